@@ -1,25 +1,42 @@
-import pdfplumber
+import os
 import re
+import sys
 from collections import Counter
 import matplotlib.pyplot as plt
 
 # For clustering similar questions
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import AgglomerativeClustering
 import numpy as np
 
+# Shared pipeline modules live with the action server
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "nlp codes"))
+from ingestion import extract_pages, ingest_many, paper_year
+from models import encode_questions
+from question_index import QuestionIndex
+from question_batch import QuestionBatch
+from cluster_hierarchy import Dendrogram, HierarchyCache, NeighbourGraph, corpus_key
+from clustering import similar_pairs
+from memory_budget import MB, MemoryBudget, PeakMemory
+from results_export import ResultExporter, paper_tables
+from cluster_summaries import summarise_clusters
+from uploads import file_digest
+
+# Merge trees per corpus; pass a directory to keep them across runs
+hierarchy_cache = HierarchyCache()
+
 def extract_clean_text(pdf_path):
+    return remove_watermarks(extract_pages(pdf_path))
+
+def remove_watermarks(pages):
     extracted_text = []
     watermark_candidates = Counter()
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text()
-            if text:
-                extracted_text.append(text)
-               
-                for line in text.split("\n"):
-                    watermark_candidates[line] += 1
+    for text in pages:
+        if text:
+            extracted_text.append(text)
+
+            for line in text.split("\n"):
+                watermark_candidates[line] += 1
 
     watermark_threshold = len(extracted_text) * 0.7  # Appears on 70%+ pages
     watermarks = {line for line, count in watermark_candidates.items() if count >= watermark_threshold}
@@ -29,7 +46,11 @@ def extract_clean_text(pdf_path):
     return clean_text
 
 def extract_questions_and_marks(clean_text):
-    questions = []
+    """
+    Parse sub-questions into a QuestionBatch (number, sub-letter, marks and the
+    cleaned question text in one shared buffer) instead of a dict per sub-question.
+    """
+    numbers, subs, texts, marks_list = [], [], [], []
     
     # Main pattern: capture main question number and its associated block.
     main_pattern = re.compile(r"Q(\d+)\)\s*(.*?)(?=\n?Q\d+\)|\Z)", re.DOTALL | re.IGNORECASE)
@@ -44,14 +65,12 @@ def extract_questions_and_marks(clean_text):
         sub_matches = sub_pattern.findall(block_text)
         for sub_match in sub_matches:
             sub_question, question_text, marks = sub_match
-            questions.append({
-                "question_no": main_question_no,
-                "sub_question": sub_question,
-                "question": question_text.strip(),
-                "marks": int(marks)
-            })
+            numbers.append(main_question_no)
+            subs.append(sub_question)
+            texts.append(clean_question_text(question_text.strip()))
+            marks_list.append(int(marks))
     
-    return questions
+    return QuestionBatch.from_texts(texts, numbers=numbers, subs=subs, marks=marks_list)
 
 def clean_question_text(text):
     """
@@ -64,79 +83,148 @@ def clean_question_text(text):
     return cleaned.strip()
 
 def format_questions(questions):
-    # Group questions by main question number.
-    grouped = {}
-    for q in questions:
-        grouped.setdefault(q["question_no"], []).append(q)
+    # Order by question number, then sub-question letter (stable, like the grouped sort).
+    order = np.lexsort((questions.subs, questions.numbers))
     
-    formatted_output = ""
-    # Iterate in order of question number.
-    for q_no in sorted(grouped.keys()):
-        formatted_output += f"Q{q_no}) "
-        # Sort sub-questions by their letter.
-        sub_questions = sorted(grouped[q_no], key=lambda x: x["sub_question"])
-        first = True
-        for sub in sub_questions:
-            clean_text_val = clean_question_text(sub["question"])
-            if first:
-                formatted_output += f"{sub['sub_question']}) {clean_text_val} [{sub['marks']}]\n"
-                first = False
-            else:
-                formatted_output += f"   {sub['sub_question']}) {clean_text_val} [{sub['marks']}]\n"
-        formatted_output += "\n"
-    return formatted_output
-
-def process_multiple_papers(pdf_paths):
-    all_questions = []
-    for pdf_path in pdf_paths:
-        clean_text = extract_clean_text(pdf_path)
-        questions = extract_questions_and_marks(clean_text)
-        all_questions.extend(questions)
-    return all_questions
-
-def cluster_similar_questions(questions, similarity_threshold=0.8):
+    lines = []
+    previous = None
+    for i in order.tolist():
+        q_no = questions.numbers[i]
+        if q_no != previous:
+            if previous is not None:
+                lines.append("\n")
+            lines.append(f"Q{q_no}) {questions.sub(i)}) {questions.text(i)} [{questions.marks[i]}]\n")
+            previous = q_no
+        else:
+            lines.append(f"   {questions.sub(i)}) {questions.text(i)} [{questions.marks[i]}]\n")
+    if previous is not None:
+        lines.append("\n")
+    return "".join(lines)
+
+def process_multiple_papers(pdf_paths, max_workers=None, subject=None, index_dir="question_index",
+                            export_dir=None, return_embeddings=False):
     """
-    Cluster questions using TF-IDF and Agglomerative Clustering.
+    Extract questions from several papers. With a subject, each paper is also added
+    to that subject's question index (the one the chatbot uses), which keeps the
+    historical trend tables current without re-analysing older papers. With an
+    export directory, each paper's questions are appended to the columnar export
+    the web platform reads, as soon as the paper is parsed.
+    With `return_embeddings`, returns (questions, embeddings); every question is
+    encoded once, and the same vectors go into the index.
+    """
+    batches = []
+    encoded = []
+    index = QuestionIndex(index_dir, subject) if subject else None
+    exporter = ResultExporter(export_dir) if export_dir else None
+    try:
+        # Papers are extracted concurrently; parsing stays in input order.
+        for result in ingest_many(pdf_paths, max_workers=max_workers):
+            if result.error:
+                print(f"Skipping {result.path}: {result.error}")
+                continue
+            clean_text = remove_watermarks(result.pages)
+            questions = extract_questions_and_marks(clean_text)
+            batches.append(questions)
+            if not len(questions):
+                continue
+            embeddings = None
+            if index is not None or return_embeddings:
+                embeddings = encode_questions(questions.texts())
+                encoded.append(embeddings)
+            if index is None and exporter is None:
+                continue
+            digest = file_digest(result.path)
+            index_clusters = None
+            if index is not None:
+                index_clusters = index_paper(index, result.path, clean_text, questions, digest=digest,
+                                             embeddings=embeddings)
+            if exporter is not None:
+                exporter.append_paper(digest, paper_tables(
+                    digest, questions, subject=subject or "", name=os.path.basename(result.path),
+                    year=paper_year(result.path, clean_text), index_clusters=index_clusters
+                ))
+    finally:
+        if index is not None:
+            index.close()
+    questions = QuestionBatch.concat(batches)
+    if return_embeddings:
+        return questions, np.concatenate(encoded) if encoded else None
+    return questions
+
+def index_paper(index, path, clean_text, questions, similarity_threshold=0.8, digest=None, embeddings=None):
+    # Same content key as chatbot uploads, so a paper ingested both ways counts once
+    texts = questions.texts()
+    return index.add_paper(
+        digest or file_digest(path),
+        texts,
+        encode_questions(texts) if embeddings is None else embeddings,
+        marks=questions.marks_list(),
+        year=paper_year(path, clean_text),
+        threshold=similarity_threshold,
+        name=os.path.basename(path)
+    )
+
+
+def cluster_similar_questions(questions, similarity_threshold=0.8, cache=hierarchy_cache, memory_budget=None):
+    """
+    Cluster questions using TF-IDF and average-linkage (cosine) agglomerative clustering.
     Returns a list of cluster labels corresponding to the input questions.
+
+    The merge tree is built once per corpus and cached, so trying another
+    threshold is only a cut of the cached tree. When the distance matrix would not
+    fit `memory_budget`, questions are instead leader-clustered over their sparse
+    TF-IDF neighbours (an approximation that needs no n^2 memory).
     """
-    # Get question texts and clean them.
-    question_texts = [clean_question_text(q["question"]) for q in questions]
-    
-    # Vectorize using TF-IDF.
-    vectorizer = TfidfVectorizer(stop_words='english')
-    X = vectorizer.fit_transform(question_texts)
-    
-    # Use Agglomerative Clustering with cosine metric.
-    clustering = AgglomerativeClustering(metric='cosine', linkage='average',
-                                         distance_threshold=1 - similarity_threshold,
-                                         n_clusters=None)
-    labels = clustering.fit_predict(X.toarray())
+    budget = memory_budget or MemoryBudget()
+    texts = questions.texts()
+    n = len(texts)
+    # linkage holds the condensed float64 distances plus a working copy
+    exact = budget.fits(2 * 8 * (n * (n - 1) // 2))
+    key = corpus_key(texts, "tfidf", "average" if exact else "neighbours")
+    hierarchy = cache.get(key) if cache is not None else None
+    if hierarchy is None:
+        # Vectorize using TF-IDF (question texts were cleaned when the batch was built).
+        vectorizer = TfidfVectorizer(stop_words='english')
+        X = vectorizer.fit_transform(texts)
+        if exact:
+            # Distances are taken from sparse row blocks (product plus its dense copy); X is never densified
+            hierarchy = Dendrogram.build(X, block_rows=budget.block_rows(20 * n))
+        else:
+            budget.note("clustering", f"distances for {n} questions exceed the budget; "
+                                      "leader clustering over TF-IDF neighbours")
+            # Neighbours per question are capped so the pair arrays (and their sort) fit too
+            rows, cols, similarities = similar_pairs(X, min_similarity=0.1,
+                                                     top_k=budget.block_rows(60 * n),
+                                                     block_size=budget.block_rows(12 * n, cap=1024))
+            hierarchy = NeighbourGraph(n, rows, cols, similarities)
+        if cache is not None:
+            cache.put(key, hierarchy)
+
+    labels = hierarchy.cut(similarity_threshold)
+    questions.labels[:] = labels
     return labels
 
 
-def plot_most_frequent_clusters(questions, labels, top_n=10):
+def plot_most_frequent_clusters(questions, labels, top_n=10, embeddings=None):
     """
     Group questions by cluster labels and plot the frequency (vertical bar chart).
-    The representative question for each cluster is taken as the first question in that cluster.
+    The representative question for each cluster is its medoid in sentence-embedding
+    space; the questions are encoded when `embeddings` are not given.
     """
-    # Count frequency of each cluster label.
-    cluster_counter = Counter(labels)
-    
-    # Create a dictionary mapping cluster label to a representative question.
-    cluster_representative = {}
-    for q, label in zip(questions, labels):
-        if label not in cluster_representative:
-            cluster_representative[label] = clean_question_text(q["question"])
+    questions.labels[:] = labels
+    if embeddings is None:
+        embeddings = encode_questions(questions.texts())
     
-    # Get the top clusters.
-    top_clusters = cluster_counter.most_common(top_n)
+    # Top clusters: largest first, then most marks, then tightest.
+    top_clusters = summarise_clusters(questions.labels, embeddings, questions.marks, top_n=top_n)
     
-    clusters = [f"Cluster {label}" for label, _ in top_clusters]
-    frequencies = [count for _, count in top_clusters]
+    clusters = [f"Cluster {summary.label}" for summary in top_clusters]
+    frequencies = [summary.size for summary in top_clusters]
     
     # Optionally, you can print representative texts for each top cluster:
-    for label, count in top_clusters:
-        print(f"Cluster {label} (Frequency: {count}): {cluster_representative[label]}")
+    for summary in top_clusters:
+        print(f"Cluster {summary.label} (Frequency: {summary.size}, spread {summary.spread:.2f}): "
+              f"{questions.text(summary.medoid)}")
     
     plt.figure(figsize=(10, 6))
     plt.bar(clusters, frequencies, color="skyblue")
@@ -148,7 +236,14 @@ def plot_most_frequent_clusters(questions, labels, top_n=10):
     plt.show()
 
 
-pdf_files = [r"C:\Users\hites\Downloads\SE Endsem 1.pdf",r"C:\Users\hites\Downloads\SE Endsem 2.pdf" ,r"C:\Users\hites\Downloads\SE Endsem 2024 paper.pdf" ]
-extracted_questions = process_multiple_papers(pdf_files)
-labels = cluster_similar_questions(extracted_questions, similarity_threshold=0.8)
-plot_most_frequent_clusters(extracted_questions, labels, top_n=10)
+# Guarded so worker processes spawned by ingest_many do not re-run the analysis
+if __name__ == "__main__":
+    pdf_files = [r"C:\Users\hites\Downloads\SE Endsem 1.pdf",r"C:\Users\hites\Downloads\SE Endsem 2.pdf" ,r"C:\Users\hites\Downloads\SE Endsem 2024 paper.pdf" ]
+    budget = MemoryBudget(512 * MB)
+    with PeakMemory() as peak:
+        extracted_questions, embeddings = process_multiple_papers(pdf_files, return_embeddings=True)
+        labels = cluster_similar_questions(extracted_questions, similarity_threshold=0.8, memory_budget=budget)
+    print(f"Peak memory: {peak.peak / MB:.1f} MB (+{peak.growth / MB:.1f} MB during the run)")
+    for adaptation in budget.adaptations:
+        print(f"  {adaptation}")
+    plot_most_frequent_clusters(extracted_questions, labels, top_n=10, embeddings=embeddings)
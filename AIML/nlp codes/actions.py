@@ -1,35 +1,216 @@
-from typing import Any, Text, Dict, List
+from typing import Any, Text, Dict, Iterable, Iterator, List, Optional, Tuple
 from rasa_sdk import Action, Tracker, FormValidationAction
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
 from rasa_sdk.types import DomainDict
 import os
 import re
-import spacy
 import random
-import PyPDF2
+import asyncio
 import logging
-from docx import Document
+import multiprocessing
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
 from datetime import datetime
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from collections import Counter
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
 import numpy as np
 from rasa_sdk.executor import CollectingDispatcher
-import matplotlib.pyplot as plt
-nlp = spacy.load("en_core_web_sm")
+from matplotlib.figure import Figure
+from clustering import candidate_pairs, pair_similarities
+from cluster_hierarchy import HierarchyCache, NeighbourGraph, corpus_key
+from models import EMBEDDING_MODEL_NAME, encode_questions
+from question_index import QuestionIndex
+from vector_search import get_searcher
+from ingestion import iter_pages, paper_year
+from uploads import ValidatedUpload, validate_upload
+from prefork import record_analysis
+from shared_arrays import SharedMatrix
+from result_store import ResultStore
+from scheduler import SchedulerBusy, Ticket, get_scheduler
+from topic_scores import TopicPredictor
+from study_plan import StudyPlanner
+from question_batch import QuestionBatch
+from paper_fingerprints import FingerprintIndex, minhash_signature, normalise
+from memory_budget import MB, MemoryBudget, PeakMemory
+from linguistic_features import QuestionFeatures, question_features, summarise
+from results_export import ResultExporter, paper_tables
+from cluster_summaries import ClusterSummary, summarise_clusters
 logger = logging.getLogger(__name__)
+_result_store = None
+_cpu_executor = None
+_search_executor = None
+_PUNCTUATION = re.compile(r'[^\w\s.?]')
+_QUESTION_MARKER = re.compile(r'(?:Q\d+\.|Question\s+\d+:|\(\d+\)\s*)')
+_FREQUENT_NOTE = re.compile(r" \((?:asked \d+ times in \d+ papers|new in this version)\)$")  # on frequent entries
+_HEAD_CHARS = 2000  # leading text kept for paper_year, which reads no further
+_topic_predictor = None
+_study_planner = None
+_hierarchy_cache = None
+_fingerprint_index = None
+_current_ticket: ContextVar[Optional[Ticket]] = ContextVar("current_ticket", default=None)
+_result_exporter = None
 
 class Config:
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    ALLOWED_EXTENSIONS = ['.pdf', '.docx']
+    ALLOWED_FORMATS = ['pdf', 'docx']  # checked against magic bytes, not the file extension
+    UPLOAD_STORAGE_DIR = "uploads"  # managed copies named by content digest; None keeps files in place
     ANALYSIS_TIMEOUT = 300  # 5 minutes
+    # CPU-heavy stages run here, never on the event loop. These are threads: numpy/BLAS and model
+    # inference release the GIL, while LDA, spaCy and regex parsing still compete with the loop for it
+    # (light actions wait a few ms at most, see tests/test_action_latency.py)
+    ANALYSIS_WORKERS = 2
+    SIMILARITY_THRESHOLD = 0.8  # default cut; any other threshold reuses the cached neighbour graph
+    HIERARCHY_CACHE_DIR = "results/hierarchies"
+    HIERARCHY_CACHE_FILES = 256  # merge trees kept on disk, least recently used evicted first
+    HIERARCHY_CACHE_MAX_AGE = 30 * 24 * 60 * 60  # seconds since a tree was last used
+    # TF-IDF blocking before embedding similarity: lower min similarity / higher top-k = more recall
+    USE_CANDIDATE_FILTER = True
+    CANDIDATE_MIN_SIMILARITY = 0.1
+    CANDIDATE_TOP_K = 20  # None keeps every neighbour above the minimum
+    CANDIDATE_ANALYZER = 'word'  # 'char_wb' also matches spelling/inflection variants
+    QUESTION_INDEX_DIR = "question_index"  # persistent per-subject history of analysed papers
+    SEARCH_TOP_K = 5
+    SEARCH_WORKERS = 2  # separate from ANALYSIS_WORKERS, so running analyses never hold up searches
+    # Run clustering/plotting in a stage process; embeddings are shared, not pickled
+    OFFLOAD_CLUSTERING = False
+    STAGE_WORKERS = 1
+    SHARED_EMBEDDING_DTYPE = 'float32'  # 'float16' halves the shared buffer
+    RESULT_STORE_PATH = "results/analysis.db"
+    RESULT_TTL = 24 * 60 * 60  # matches utter_privacy_policy
+    # Re-scans/re-exports of a known paper reuse its analysis; only differing questions are processed
+    FINGERPRINT_INDEX_PATH = "results/fingerprints.db"
+    NEAR_DUPLICATE_SIMILARITY = 0.8  # estimated Jaccard similarity of the question sets
+    # Admission control for heavy actions: concurrent runs per worker, waiting room, priority (lower first)
+    ACTION_CONCURRENCY = {
+        "action_analyze_question_paper": 2,
+        "action_generate_mock_test": 4,
+        "action_search_similar_questions": 8
+    }
+    ACTION_PRIORITY = {
+        "action_search_similar_questions": 0,
+        "action_generate_mock_test": 1,
+        "action_analyze_question_paper": 2
+    }
+    ACTION_QUEUE_SIZE = 20  # per action; further requests are turned away
+    # Topic importance = weighted share of past papers, recency-decayed share and marks weight
+    PREDICTION_WEIGHTS = {"frequency": 0.5, "recency": 0.3, "marks": 0.2}
+    PREDICTION_HALF_LIFE = 2.0  # years; an exam this old counts half as much as the latest
+    PREDICTION_REFRESH_INTERVAL = 300  # seconds between background retrains
+    PREDICTION_TOP_K = 5
+    PREDICTION_TREND_YEARS = 4  # exam years of per-year history shown with each predicted topic
+    MAX_STUDY_DAYS = 365
+    REVISION_SHARE = 0.15  # final days of every plan are kept for revision
+    # Per-analysis memory allowance; stages that would exceed it switch to blocked or
+    # streaming variants (None: no limit)
+    ANALYSIS_MEMORY_BUDGET = 512 * MB
+    # Linguistic features (command verbs, noun-phrase topics, sentences) come from one nlp.pipe pass
+    FEATURE_BATCH_SIZE = 256
+    FEATURE_PROCESSES = 1  # >1 only pays off for thousands of questions (see linguistic_features)
+    # Columnar per-question/cluster/paper results for the web platform, appended per analysed paper
+    EXPORT_DIR = "results/export"
+    EXPORT_FORMAT = None  # 'parquet' when pyarrow is installed, else memory-mappable 'npy' columns
+
+def get_result_store() -> ResultStore:
+    global _result_store
+    if _result_store is None:
+        _result_store = ResultStore(Config.RESULT_STORE_PATH, ttl=Config.RESULT_TTL)
+    return _result_store
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ThreadPoolExecutor(max_workers=Config.ANALYSIS_WORKERS,
+                                           thread_name_prefix="analysis")
+    return _cpu_executor
+
+def get_search_executor() -> ThreadPoolExecutor:
+    global _search_executor
+    if _search_executor is None:
+        _search_executor = ThreadPoolExecutor(max_workers=Config.SEARCH_WORKERS,
+                                              thread_name_prefix="search")
+    return _search_executor
+
+def get_topic_predictor() -> TopicPredictor:
+    global _topic_predictor
+    if _topic_predictor is None:
+        _topic_predictor = TopicPredictor(Config.QUESTION_INDEX_DIR, weights=Config.PREDICTION_WEIGHTS,
+                                          half_life=Config.PREDICTION_HALF_LIFE,
+                                          refresh_interval=Config.PREDICTION_REFRESH_INTERVAL)
+    return _topic_predictor
+
+def get_study_planner() -> StudyPlanner:
+    global _study_planner
+    if _study_planner is None:
+        _study_planner = StudyPlanner(get_topic_predictor(), revision_share=Config.REVISION_SHARE)
+    return _study_planner
+
+def get_hierarchy_cache() -> HierarchyCache:
+    global _hierarchy_cache
+    if _hierarchy_cache is None:
+        _hierarchy_cache = HierarchyCache(Config.HIERARCHY_CACHE_DIR, max_files=Config.HIERARCHY_CACHE_FILES,
+                                          max_age=Config.HIERARCHY_CACHE_MAX_AGE)
+    return _hierarchy_cache
+
+def get_result_exporter() -> ResultExporter:
+    global _result_exporter
+    if _result_exporter is None:
+        _result_exporter = ResultExporter(Config.EXPORT_DIR, Config.EXPORT_FORMAT)
+    return _result_exporter
+
+def get_fingerprint_index() -> FingerprintIndex:
+    global _fingerprint_index
+    if _fingerprint_index is None:
+        _fingerprint_index = FingerprintIndex(Config.FINGERPRINT_INDEX_PATH)
+    return _fingerprint_index
+
+def get_action_scheduler():
+    return get_scheduler(Config.ACTION_CONCURRENCY, max_queue=Config.ACTION_QUEUE_SIZE)
+
+class ScheduledAction(Action, ABC):
+    """Base for expensive actions: admission control runs before `_run`"""
+
+    async def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        try:
+            ticket = get_action_scheduler().submit(
+                self.name(), tracker.sender_id, Config.ACTION_PRIORITY.get(self.name(), 1)
+            )
+        except SchedulerBusy:
+            dispatcher.utter_message(
+                text="I'm handling a lot of requests right now. Please try again in a minute."
+            )
+            return []
+
+        if ticket.position:
+            dispatcher.utter_message(
+                text=f"I'm a little busy, so your request was queued at position {ticket.position}."
+            )
+        _current_ticket.set(ticket)
+        async with ticket:
+            return await self._run(dispatcher, tracker, domain)
+
+    @staticmethod
+    def _hold_slot_until(work: Future):
+        """Keep this request's slot until `work` finishes, even if `_run` stops waiting for it"""
+        ticket = _current_ticket.get()
+        if ticket is not None:
+            ticket.hold_until(work)
+
+    @abstractmethod
+    async def _run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+        """Abstract, so the SDK's action scan does not register this base class"""
 
 class ActionHandleNavigation(Action):
     def name(self) -> Text:
         return "action_handle_navigation"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
@@ -59,7 +240,7 @@ class ActionHandleSmallTalk(Action):
     def name(self) -> Text:
         return "action_handle_small_talk"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+    async def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         user_message = tracker.latest_message.get("text").lower()
 
         if "hello" in user_message:
@@ -73,11 +254,11 @@ class ActionHandleSmallTalk(Action):
         return []
 
 
-class ActionGenerateMockTest(Action):
+class ActionGenerateMockTest(ScheduledAction):
     def name(self) -> Text:
         return "action_generate_mock_test"
 
-    def run(self, dispatcher: CollectingDispatcher, 
+    async def _run(self, dispatcher: CollectingDispatcher, 
             tracker: Tracker, 
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
 
@@ -225,85 +406,264 @@ class ActionHandleFileUpload(Action):
     def name(self) -> Text:
         return "action_handle_file_upload"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
 
         try:
             file_path = tracker.get_slot("uploaded_file")
             
-            # Security checks
-            if not os.path.exists(file_path):
-                raise ValueError("File not found")
-                
-            if os.path.getsize(file_path) > Config.MAX_FILE_SIZE:
-                raise ValueError(f"File exceeds {Config.MAX_FILE_SIZE//1024//1024}MB limit")
-                
-            if not any(file_path.lower().endswith(ext) for ext in Config.ALLOWED_EXTENSIONS):
-                raise ValueError("Unsupported file type")
+            # Security checks: size limit, magic bytes and digest in one read of the file
+            upload = await asyncio.to_thread(
+                validate_upload,
+                file_path,
+                max_size=Config.MAX_FILE_SIZE,
+                allowed_formats=Config.ALLOWED_FORMATS,
+                storage_dir=Config.UPLOAD_STORAGE_DIR
+            )
             
-            return [SlotSet("uploaded_file", file_path)]
+            return [SlotSet("uploaded_file", upload.path), SlotSet("upload", upload._asdict())]
 
         except Exception as e:
             logger.error(f"File upload failed: {str(e)}")
             dispatcher.utter_message(text=f"Upload error: {str(e)}")
-            return [SlotSet("uploaded_file", None)]
+            return [SlotSet("uploaded_file", None), SlotSet("upload", None)]
 
-class ActionAnalyzeQuestionPaper(Action):
+class ActionAnalyzeQuestionPaper(ScheduledAction):
     def name(self) -> Text:
         return "action_analyze_question_paper"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def _run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
 
-        file_path = tracker.get_slot("uploaded_file")
-        
         try:
-            text = self._extract_text(file_path)
-            questions = self._process_text(text)
-            
-            # New: Obtain semantic clusters and generate a vertical bar chart
-            cluster_labels = self._get_cluster_labels(questions)
-            image_path = self._plot_question_clusters(questions, cluster_labels, top_n=10)
-            
-            analysis = {
-                "topics": self._identify_topics(questions),
-                "frequent_questions": self._find_frequent_questions(questions),
-                "difficulty": self._estimate_difficulty(questions),
-                "question_types": self._categorize_question_types(questions),
-                "cluster_plot": image_path
-            }
+            upload = await asyncio.to_thread(self._get_upload, tracker)
+            subject = (tracker.get_slot("selected_subject") or "general").lower()
+            # CPU-bound pipeline goes to the dedicated executor so light actions stay responsive
+            # A timeout cannot stop the worker thread, so the slot stays taken until it is done
+            work = get_cpu_executor().submit(self._analyze, upload, subject)
+            self._hold_slot_until(work)
+            analysis, handle = await asyncio.wait_for(asyncio.wrap_future(work), timeout=Config.ANALYSIS_TIMEOUT)
             
             dispatcher.utter_message(text=self._format_analysis(analysis))
             # If your channel supports images, send the plot image as well.
-            dispatcher.utter_message(image=image_path)
-            return [SlotSet("analysis_results", analysis)]
+            dispatcher.utter_message(image=analysis["cluster_plot"])
+            # The tracker only carries a handle; later actions fetch the analysis on demand
+            return [SlotSet("analysis_handle", handle)]
 
         except Exception as e:
             logger.exception("Analysis failed")
             dispatcher.utter_message(text=f"Analysis error: {str(e)}")
             return []
 
-    def _extract_text(self, file_path: Text) -> Text:
-        """Extract text from supported file types"""
+        finally:
+            # Lets a pre-forked worker recycle itself after N analyses
+            record_analysis()
+
+    def _analyze(self, upload: ValidatedUpload, subject: Text) -> Tuple[Dict[Text, Any], Text]:
+        """Analysis pipeline, stored in the result store; blocking, so it runs on the CPU executor"""
+        store = get_result_store()
+        # Byte-identical upload under the same subject: the stored analysis stands as is
+        handle = store.find_by_digest(upload.digest, subject)
+        analysis = store.get(handle)
+        if analysis is not None:
+            if not self._exported(upload.digest):
+                # Stored, but its export failed or predates the export directory
+                pages = self._extract_pages(upload.path, upload.file_format)
+                questions, head = self._process_pages(pages, MemoryBudget(Config.ANALYSIS_MEMORY_BUDGET))
+                self._export(upload, subject, paper_year(upload.original_path, head),
+                             questions, analysis, features=self._linguistic_features(questions))
+            return analysis, handle
+
+        budget = MemoryBudget(Config.ANALYSIS_MEMORY_BUDGET)
+        with PeakMemory() as peak:
+            pages = self._extract_pages(upload.path, upload.file_format)
+            questions, head = self._process_pages(pages, budget)
+            if not len(questions):
+                raise ValueError("No numbered questions (e.g. 'Q1.') found in the document")
+            signature = minhash_signature(questions.texts())
+            analysis = self._reuse_near_duplicate(questions, signature, subject)
+            if analysis is None:
+                analysis = self._full_analysis(upload, subject, head, questions, budget)
+            else:
+                # Not clustered again: the export carries its questions without cluster rows
+                self._export(upload, subject, paper_year(upload.original_path, head),
+                             questions, analysis, features=self._linguistic_features(questions))
+        analysis["memory"] = {
+            "peak_mb": round(peak.peak / MB, 1),
+            "growth_mb": round(peak.growth / MB, 1),
+            "budget_mb": None if budget.limit is None else round(budget.limit / MB, 1),
+            "adaptations": budget.adaptations
+        }
+        logger.info("Analysis of %s: peak memory %.1f MB (+%.1f MB during the run), %d adaptations",
+                    upload.digest[:12], peak.peak / MB, peak.growth / MB, len(budget.adaptations))
+        handle = store.put(analysis, digest=upload.digest, subject=subject)
+        get_fingerprint_index().add(upload.digest, handle, questions.texts(), signature, subject=subject)
+        return analysis, handle
+
+    def _full_analysis(self, upload: ValidatedUpload, subject: Text, head: Text,
+                       questions: QuestionBatch, budget: MemoryBudget) -> Dict[Text, Any]:
+        # New: Obtain semantic clusters and generate a vertical bar chart
+        embeddings = encode_questions(questions.texts())
+        image_path = f"question_clusters_{upload.digest[:12]}.png"
+        cluster_labels, comparison_stats, image_path = self._cluster_and_plot(questions, embeddings,
+                                                                              image_path, budget)
+        year = paper_year(upload.original_path, head)
+        index_clusters, history = self._update_question_index(subject, upload, questions, embeddings, year)
+        features = self._linguistic_features(questions)
+        questions.labels[:] = cluster_labels
+        summaries = summarise_clusters(questions.labels, embeddings, questions.marks)
+        frequent_clusters = self._frequent_clusters(questions, history, summaries)
+        
+        analysis = {
+            "topics": self._identify_topics(questions),
+            "frequent_questions": [members[0] for members in frequent_clusters],
+            # Members of each frequent question's cluster, medoid first, so a revised paper can re-pick it
+            "frequent_clusters": frequent_clusters,
+            "difficulty": self._estimate_difficulty(questions),
+            "question_types": self._categorize_question_types(questions, features),
+            "linguistic_features": summarise(features),
+            "cluster_plot": image_path,
+            "comparison_stats": comparison_stats
+        }
+        self._export(upload, subject, year, questions, analysis, index_clusters, features, summaries)
+        return analysis
+
+    def _export(self, upload: ValidatedUpload, subject: Text, year: Optional[int], questions: QuestionBatch,
+                analysis: Dict[Text, Any], index_clusters: Optional[List[int]] = None,
+                features: Optional[List[QuestionFeatures]] = None,
+                summaries: Optional[List[ClusterSummary]] = None):
+        """Append this paper's rows to the columnar export read by the web platform"""
+        try:
+            get_result_exporter().append_paper(upload.digest, paper_tables(
+                upload.digest, questions, subject=subject, name=os.path.basename(upload.original_path),
+                year=year, difficulty=analysis["difficulty"], topics=analysis["topics"],
+                question_types=analysis["question_types"], index_clusters=index_clusters, features=features,
+                summaries=summaries
+            ))
+        except Exception as e:
+            # The chat report does not depend on the export
+            logger.warning(f"Result export failed: {str(e)}")
+
+    def _exported(self, paper: Text) -> bool:
+        try:
+            return get_result_exporter().has_paper(paper)
+        except Exception as e:
+            # The chat report does not depend on the export
+            logger.warning(f"Result export unavailable: {str(e)}")
+            return True
+
+    def _reuse_near_duplicate(self, questions: QuestionBatch, signature: np.ndarray,
+                              subject: Text) -> Optional[Dict[Text, Any]]:
+        """
+        Analysis of a known near-identical paper, updated with only the questions that differ.
+
+        A re-scan of a paper already in the question index is not indexed again, so
+        history and trends do not count the same exam twice.
+        """
+        texts = questions.texts()
+        match = get_fingerprint_index().find(texts, min_similarity=Config.NEAR_DUPLICATE_SIMILARITY,
+                                             signature=signature, subject=subject)
+        stored = get_result_store().get(match.handle) if match else None
+        if stored is None:
+            return None
+
+        known = {normalise(t) for t in match.questions}
+        current = {normalise(t) for t in texts}
+        added = QuestionBatch.from_texts([t for t in texts if normalise(t) not in known])
+        removed = QuestionBatch.from_texts([t for t in match.questions if normalise(t) not in current])
+        question_types = Counter(stored["question_types"])
+        question_types.update(self._categorize_question_types(added))
+        question_types.subtract(self._categorize_question_types(removed))
+        # Members are stored with their history/"new" note; a cluster goes only when all of them are gone
+        dropped = {normalise(t) for t in removed}
+        frequent_clusters = []
+        for members in stored.get("frequent_clusters") or [[entry] for entry in stored["frequent_questions"]]:
+            remaining = [m for m in members if normalise(_FREQUENT_NOTE.sub("", m)) not in dropped]
+            if remaining and remaining[0] != members[0]:
+                # The medoid was removed: re-pick it among the remaining members, only these are encoded
+                medoid = summarise_clusters(np.zeros(len(remaining), dtype=np.int64), encode_questions(
+                    [_FREQUENT_NOTE.sub("", m) for m in remaining]))[0].medoid
+                remaining.insert(0, remaining.pop(medoid))
+            if remaining:
+                frequent_clusters.append(remaining)
+        frequent_clusters += [[f"{q} (new in this version)"] for q in added]
+        logger.info("Near-duplicate of %s (similarity %.2f): %d questions added, %d removed",
+                    match.digest[:12], match.similarity, len(added), len(removed))
+        return dict(
+            stored,
+            frequent_questions=[members[0] for members in frequent_clusters],
+            frequent_clusters=frequent_clusters,
+            difficulty=self._estimate_difficulty(questions),
+            # Every type either version has, never below zero
+            question_types={q_type: max(count, 0) for q_type, count in question_types.items()},
+            near_duplicate={"similarity": round(match.similarity, 2), "added": len(added), "removed": len(removed)}
+        )
+
+    def _cluster_and_plot(self, questions: QuestionBatch, embeddings: np.ndarray, image_path: Text,
+                          budget: MemoryBudget) -> Tuple[List[int], Dict[Text, Any], Text]:
+        """Cluster labels, comparison stats and plot path, computed in a stage process if enabled"""
+        if not Config.OFFLOAD_CLUSTERING:
+            cluster_labels, comparison_stats = self._get_cluster_labels(questions, embeddings, budget=budget)
+            image_path = self._plot_question_clusters(questions, cluster_labels, top_n=10, image_path=image_path)
+            return cluster_labels, comparison_stats, image_path
+
+        # Only the segment handle is pickled; the stage process maps the same memory
+        with SharedMatrix.from_array(embeddings, dtype=Config.SHARED_EMBEDDING_DTYPE) as shared:
+            future = _get_stage_executor().submit(_cluster_stage, shared.handle, questions, image_path, budget)
+            cluster_labels, comparison_stats, image_path, adaptations = future.result(timeout=Config.ANALYSIS_TIMEOUT)
+        budget.adaptations.extend(adaptations)
+        return cluster_labels, comparison_stats, image_path
+
+    def _get_upload(self, tracker: Tracker) -> ValidatedUpload:
+        """Validated upload handle from the upload action, validating now if that step was skipped"""
+        upload = tracker.get_slot("upload")
+        if upload and upload.get("path") == tracker.get_slot("uploaded_file"):
+            return ValidatedUpload(**upload)
+        return validate_upload(tracker.get_slot("uploaded_file"), max_size=Config.MAX_FILE_SIZE,
+                               allowed_formats=Config.ALLOWED_FORMATS)
+
+    def _extract_pages(self, file_path: Text, file_format: Optional[Text] = None) -> Iterator[Text]:
+        """Text per page, extracted as it is consumed (file type detected by content, not extension)"""
         try:
-            if file_path.endswith('.pdf'):
-                with open(file_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    return " ".join([page.extract_text() for page in reader.pages])
-            elif file_path.endswith('.docx'):
-                doc = Document(file_path)
-                return " ".join([para.text for para in doc.paragraphs])
+            yield from iter_pages(file_path, file_format)
         except Exception as e:
             raise RuntimeError(f"Text extraction failed: {str(e)}")
 
-    def _process_text(self, text: Text) -> List[Text]:
-        """Clean and split questions"""
-        text = re.sub(r'[^\w\s.?]', '', text)
-        return [q.strip() for q in re.split(r'(?:Q\d+\.|Question\s+\d+:|\(\d+\)\s*)', text) if q.strip()]
+    def _process_pages(self, pages: Iterable[Text], budget: MemoryBudget) -> Tuple[QuestionBatch, Text]:
+        """
+        Clean and split questions page by page, with the paper's leading text for its year.
+
+        Markers never end on a page break, so carrying the unfinished last question into
+        the next page gives the same questions as splitting the joined document. Pages are
+        read lazily and reading stops once the text read so far would not fit the budget.
+        """
+        texts, carry, header = [], None, True
+        head, text_bytes = [], 0
+        for number, page in enumerate(pages, 1):
+            if text_bytes < _HEAD_CHARS:
+                head.append(page)
+            text_bytes += len(page)
+            page = _PUNCTUATION.sub('', page)
+            parts = _QUESTION_MARKER.split(page if carry is None else f"{carry} {page}")
+            if header:
+                # Header pages and the text before the first marker are not questions
+                header = len(parts) == 1
+                parts = parts[1:]
+            if not header:
+                carry = parts.pop()
+                texts.extend(q for q in map(self._clean_question_text, parts) if q)
+            # The question texts and the batch built from them each hold about one copy of the text
+            if not budget.fits(2 * text_bytes):
+                budget.note("text", f"{text_bytes / MB:.1f} MB of text by page {number}; "
+                                    f"later pages are not analysed")
+                break
+        if carry is not None and self._clean_question_text(carry):
+            texts.append(self._clean_question_text(carry))
+        return QuestionBatch.from_texts(texts), " ".join(head)[:_HEAD_CHARS]
 
-    def _identify_topics(self, questions: List[Text]) -> List[Text]:
+    def _identify_topics(self, questions: QuestionBatch) -> List[Text]:
         """LDA Topic Modeling"""
         vectorizer = TfidfVectorizer(max_df=0.95, min_df=2, stop_words='english')
         dtm = vectorizer.fit_transform(questions)
@@ -312,43 +672,65 @@ class ActionAnalyzeQuestionPaper(Action):
         return [", ".join([vectorizer.get_feature_names_out()[i] for i in topic.argsort()[-3:]]) 
                 for topic in lda.components_]
 
-    def _find_frequent_questions(self, questions: List[Text]) -> List[Text]:
-        """Semantic clustering to group similar questions and return representative questions"""
-        from sentence_transformers import SentenceTransformer
-        from sklearn.metrics.pairwise import cosine_similarity
+    def _frequent_clusters(self, questions: QuestionBatch, history: Optional[List[Tuple[int, int]]],
+                           summaries: List[ClusterSummary]) -> List[List[Text]]:
+        """Entries of every cluster's members, medoid first; clusters in frequent-question order"""
+        # The medoid represents each cluster, largest clusters first
+        if history is not None:
+            # Most frequently asked across past papers first; the cluster ranking breaks ties
+            summaries = sorted(summaries, key=lambda summary: history[summary.medoid], reverse=True)
+        members: Dict[int, List[int]] = {}
+        for i, label in enumerate(questions.labels.tolist()):
+            members.setdefault(label, []).append(i)
 
-        # Clean and prepare question texts
-        question_texts = [self._clean_question_text(q) for q in questions]
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        embeddings = model.encode(question_texts, convert_to_tensor=False)
-        cosine_sim = cosine_similarity(embeddings)
-        
-        threshold = 0.8
-        n = len(question_texts)
-        visited = [False] * n
-        clusters = []
-        for i in range(n):
-            if not visited[i]:
-                cluster = [i]
-                visited[i] = True
-                for j in range(i+1, n):
-                    if not visited[j] and cosine_sim[i][j] >= threshold:
-                        cluster.append(j)
-                        visited[j] = True
-                clusters.append(cluster)
-        # Pick representative question from each cluster
-        representatives = []
-        for cluster in clusters:
-            representatives.append(question_texts[cluster[0]])
-        return representatives
-
-    def _estimate_difficulty(self, questions: List[Text]) -> Text:
+        def entry(i: int) -> Text:
+            if history is None:
+                return questions.text(i)
+            return f"{questions.text(i)} (asked {history[i][0]} times in {history[i][1]} papers)"
+
+        return [[entry(summary.medoid)] + [entry(i) for i in members[summary.label] if i != summary.medoid]
+                for summary in summaries]
+
+    def _update_question_index(self, subject: Text, upload: ValidatedUpload, questions: QuestionBatch,
+                               embeddings: np.ndarray,
+                               year: Optional[int] = None
+                               ) -> Tuple[Optional[List[int]], Optional[List[Tuple[int, int]]]]:
+        """Add this paper to the subject's question index; historical cluster id and frequency per question"""
+        try:
+            index = QuestionIndex(Config.QUESTION_INDEX_DIR, subject)
+            try:
+                # Keyed by content digest so re-uploads of the same file are not counted twice
+                cluster_ids = index.add_paper(
+                    upload.digest,
+                    questions.texts(),
+                    embeddings,
+                    marks=questions.marks_list(),
+                    year=year,
+                    threshold=Config.SIMILARITY_THRESHOLD,
+                    name=os.path.basename(upload.original_path)
+                )
+                frequencies = index.cluster_frequencies(cluster_ids)
+            finally:
+                index.close()
+        except Exception as e:
+            # History is an enrichment; the single-paper analysis still stands without it
+            logger.warning(f"Question index update failed: {str(e)}")
+            return None, None
+        return cluster_ids, [frequencies.get(c, (1, 1)) for c in cluster_ids]
+
+    def _estimate_difficulty(self, questions: QuestionBatch) -> Text:
         """Heuristic difficulty estimation"""
-        avg_length = np.mean([len(q.split()) for q in questions])
+        # Cleaned questions are stripped, so each has one more word than whitespace runs
+        avg_length = (len(re.findall(r"\s+", questions.buffer)) + len(questions)) / max(len(questions), 1)
         return "Advanced" if avg_length > 50 else "Intermediate" if avg_length > 25 else "Basic"
 
-    def _categorize_question_types(self, questions: List[Text]) -> Dict[Text, int]:
-        """Question type classification"""
+    def _linguistic_features(self, questions: QuestionBatch) -> List[QuestionFeatures]:
+        return question_features(questions, batch_size=Config.FEATURE_BATCH_SIZE,
+                                 n_process=Config.FEATURE_PROCESSES)
+
+    def _categorize_question_types(self, questions: QuestionBatch,
+                                   features: Optional[List[QuestionFeatures]] = None) -> Dict[Text, int]:
+        """Question type classification from the command verbs, with phrase patterns as a fallback"""
         patterns = {
             'Definition': r'define|what is|explain',
             'Calculation': r'calculate|solve|compute|formula',
@@ -356,10 +738,20 @@ class ActionAnalyzeQuestionPaper(Action):
             'Comparison': r'compare|contrast|difference between',
             'Enumeration': r'list|name|give examples'
         }
-        return {q_type: sum(1 for q in questions if re.search(pattern, q, re.IGNORECASE))
+        verbs = {
+            'Definition': {'define', 'explain', 'describe', 'state'},
+            'Calculation': {'calculate', 'solve', 'compute', 'evaluate', 'determine'},
+            'Problem Solving': {'prove', 'demonstrate', 'derive', 'show', 'design'},
+            'Comparison': {'compare', 'contrast', 'differentiate', 'distinguish'},
+            'Enumeration': {'list', 'name', 'enumerate', 'mention'}
+        }
+        features = self._linguistic_features(questions) if features is None else features
+        return {q_type: sum(1 for q, f in zip(questions, features)
+                            if verbs[q_type].intersection(f.command_verbs) or re.search(pattern, q, re.IGNORECASE))
                 for q_type, pattern in patterns.items()}
 
-    def _format_analysis(self, analysis: Dict) -> Text:
+    @staticmethod
+    def _format_analysis(analysis: Dict) -> Text:
         """Generate formatted report"""
         return (
             f"📊 Analysis Report:\n\n"
@@ -367,7 +759,16 @@ class ActionAnalyzeQuestionPaper(Action):
             f"📌 Frequent Questions:\n{chr(10).join(analysis['frequent_questions'])}\n\n"
             f"📈 Difficulty: {analysis['difficulty']}\n\n"
             f"🧩 Question Types:\n{chr(10).join(f'- {k}: {v}' for k,v in analysis['question_types'].items())}\n\n"
-            f"🖼 Cluster Plot saved at: {analysis['cluster_plot']}"
+            + (f"🗣 Most common instructions: "
+               f"{', '.join(f'{verb} ({n})' for verb, n in analysis['linguistic_features']['command_verbs'])}\n\n"
+               if analysis.get("linguistic_features", {}).get("command_verbs") else "")
+            + f"⚡ Similarity checks: {analysis['comparison_stats']['scored_pairs']} of "
+            f"{analysis['comparison_stats']['total_pairs']} pairs scored "
+            f"({analysis['comparison_stats']['avoided_pairs']} avoided)\n\n"
+            + (f"♻️ Matched an earlier version of this paper ({analysis['near_duplicate']['similarity']:.0%} similar); "
+               f"{analysis['near_duplicate']['added']} new and {analysis['near_duplicate']['removed']} removed "
+               f"questions processed\n\n" if analysis.get("near_duplicate") else "")
+            + f"🖼 Cluster Plot saved at: {analysis['cluster_plot']}"
         )
     
     # ----------------------- NEW HELPER METHODS ---------------------------
@@ -379,33 +780,66 @@ class ActionAnalyzeQuestionPaper(Action):
         cleaned = re.sub(r"\s{2,}", " ", cleaned)
         return cleaned.strip()
 
-    def _get_cluster_labels(self, questions: List[Text]) -> List[int]:
-        """Compute cluster labels for questions using sentence embeddings"""
-        from sentence_transformers import SentenceTransformer
-        from sklearn.metrics.pairwise import cosine_similarity
+    def _get_cluster_labels(self, questions: QuestionBatch,
+                            embeddings: Optional[np.ndarray] = None,
+                            threshold: Optional[float] = None,
+                            budget: Optional[MemoryBudget] = None) -> Tuple[List[int], Dict[Text, Any]]:
+        """Cluster labels at `threshold`, cut from the corpus's cached neighbour graph"""
+        threshold = Config.SIMILARITY_THRESHOLD if threshold is None else threshold
+        budget = budget or MemoryBudget(Config.ANALYSIS_MEMORY_BUDGET)
+        question_texts = questions.texts()
+        n = len(question_texts)
+        use_filter = Config.USE_CANDIDATE_FILTER
+        # Scoring every pair holds two int64 indices and a float32 similarity per pair
+        if not use_filter and not budget.fits(20 * (n * (n - 1) // 2)):
+            budget.note("pairs", f"all {n * (n - 1) // 2} pairs exceed the budget; scoring TF-IDF candidates only")
+            use_filter = True
+        key = corpus_key(question_texts, EMBEDDING_MODEL_NAME, use_filter,
+                         Config.CANDIDATE_MIN_SIMILARITY, Config.CANDIDATE_TOP_K, Config.CANDIDATE_ANALYZER)
+        graph = get_hierarchy_cache().get(key)
+        if graph is None:
+            graph = self._build_neighbour_graph(question_texts, embeddings, use_filter, budget)
+            get_hierarchy_cache().put(key, graph)
+        return graph.cut(threshold).tolist(), graph.stats
 
-        question_texts = [self._clean_question_text(q) for q in questions]
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        embeddings = model.encode(question_texts, convert_to_tensor=False)
-        cosine_sim = cosine_similarity(embeddings)
-        
-        threshold = 0.8
+    def _build_neighbour_graph(self, question_texts: List[Text],
+                               embeddings: Optional[np.ndarray] = None,
+                               use_filter: Optional[bool] = None,
+                               budget: Optional[MemoryBudget] = None) -> NeighbourGraph:
+        """Score candidate pairs once; every threshold is then a cut of the sorted pairs"""
         n = len(question_texts)
-        visited = [False] * n
-        labels = [-1] * n
-        cluster_id = 0
-        for i in range(n):
-            if not visited[i]:
-                labels[i] = cluster_id
-                visited[i] = True
-                for j in range(i+1, n):
-                    if not visited[j] and cosine_sim[i][j] >= threshold:
-                        labels[j] = cluster_id
-                        visited[j] = True
-                cluster_id += 1
-        return labels
-
-    def _plot_question_clusters(self, questions: List[Text], cluster_labels: List[int], top_n=10) -> Text:
+        use_filter = Config.USE_CANDIDATE_FILTER if use_filter is None else use_filter
+        budget = budget or MemoryBudget(Config.ANALYSIS_MEMORY_BUDGET)
+        if use_filter:
+            # A block of the TF-IDF product can be dense: an index and a score per column
+            block_size = budget.block_rows(12 * n, cap=1024)
+            if block_size < min(n, 1024):
+                budget.note("candidates", f"TF-IDF product in blocks of {block_size} rows")
+            # Only pairs sharing enough vocabulary are worth an embedding comparison
+            rows, cols, stats = candidate_pairs(
+                question_texts,
+                min_similarity=Config.CANDIDATE_MIN_SIMILARITY,
+                top_k=Config.CANDIDATE_TOP_K,
+                analyzer=Config.CANDIDATE_ANALYZER,
+                block_size=block_size
+            )
+        else:
+            rows, cols = np.triu_indices(n, k=1)
+            stats = {"total_pairs": len(rows), "scored_pairs": len(rows),
+                     "avoided_pairs": 0, "avoided_ratio": 0.0}
+
+        if embeddings is None:
+            embeddings = encode_questions(question_texts)
+        # Each pair gathers both embedding rows, plus float32 copies when stored narrower
+        dim = embeddings.shape[1] if embeddings.ndim > 1 else 1
+        block_size = budget.block_rows(2 * dim * (embeddings.itemsize + 4))
+        if block_size < len(rows):
+            budget.note("similarities", f"{len(rows)} pairs scored in blocks of {block_size}")
+        similarities = pair_similarities(embeddings, rows, cols, block_size=block_size)
+        return NeighbourGraph(n, rows, cols, similarities, stats)
+
+    def _plot_question_clusters(self, questions: QuestionBatch, cluster_labels: List[int], top_n=10,
+                                image_path: Text = "question_clusters.png") -> Text:
         """Generate a vertical bar chart of the top clusters and save it as an image"""
         from collections import Counter
         
@@ -414,19 +848,198 @@ class ActionAnalyzeQuestionPaper(Action):
         clusters = [f"Cluster {label}" for label, _ in top_clusters]
         frequencies = [count for _, count in top_clusters]
         
-        plt.figure(figsize=(12, 6))
-        plt.bar(clusters, frequencies, color="skyblue")
-        plt.xlabel("Clusters (Grouped Question Types)")
-        plt.ylabel("Frequency")
-        plt.title("Top Frequently Asked Question Types")
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
+        # Object-oriented API: pyplot's global figure state is not safe across executor threads
+        fig = Figure(figsize=(12, 6))
+        ax = fig.add_subplot()
+        ax.bar(clusters, frequencies, color="skyblue")
+        ax.set_xlabel("Clusters (Grouped Question Types)")
+        ax.set_ylabel("Frequency")
+        ax.set_title("Top Frequently Asked Question Types")
+        ax.tick_params(axis='x', labelrotation=45)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment('right')
+        fig.tight_layout()
         
-        image_path = "question_clusters.png"
-        plt.savefig(image_path)
-        plt.close()
+        fig.savefig(image_path)
         return image_path
 
+_stage_executor = None
+
+def _get_stage_executor() -> ProcessPoolExecutor:
+    global _stage_executor
+    if _stage_executor is None:
+        # Spawned, not forked: the server is threaded and holds loaded models (as in ocr.py).
+        # Workers are reused, so each imports the pipeline code once
+        _stage_executor = ProcessPoolExecutor(max_workers=Config.STAGE_WORKERS,
+                                              mp_context=multiprocessing.get_context("spawn"))
+    return _stage_executor
+
+def _cluster_stage(embedding_handle: Dict[Text, Any], questions: QuestionBatch, image_path: Text,
+                   budget: MemoryBudget) -> Tuple[List[int], Dict[Text, Any], Text, List[Text]]:
+    """Stage-process side of _cluster_and_plot: attach to the shared embeddings, never copy them in"""
+    analyzer = ActionAnalyzeQuestionPaper()
+    with SharedMatrix.attach(embedding_handle) as shared:
+        cluster_labels, comparison_stats = analyzer._get_cluster_labels(questions, shared.array, budget=budget)
+    image_path = analyzer._plot_question_clusters(questions, cluster_labels, top_n=10, image_path=image_path)
+    # The budget object here is a copy; hand its notes back to the caller's
+    return cluster_labels, comparison_stats, image_path, budget.adaptations
+
+class ActionShowLastAnalysis(Action):
+    def name(self) -> Text:
+        return "action_show_last_analysis"
+
+    async def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+
+        handle = tracker.get_slot("analysis_handle")
+        try:
+            # Only the handle is in the tracker; the report comes back from the result store
+            analysis = await asyncio.to_thread(get_result_store().get, handle)
+        except Exception as e:
+            logger.exception("Loading the stored analysis failed")
+            dispatcher.utter_message(text=f"Analysis error: {str(e)}")
+            return []
+        if analysis is None:
+            # Never analysed in this conversation, or past the retention period
+            dispatcher.utter_message(text="There is no recent analysis to show. Upload a question paper first.")
+            return [SlotSet("analysis_handle", None)] if handle else []
+        dispatcher.utter_message(text=ActionAnalyzeQuestionPaper._format_analysis(analysis))
+        dispatcher.utter_message(image=analysis["cluster_plot"])
+        return []
+
+class ActionSearchSimilarQuestions(ScheduledAction):
+    def name(self) -> Text:
+        return "action_search_similar_questions"
+
+    async def _run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+
+        subject = (tracker.get_slot("selected_subject") or "general").lower()
+        query = self._extract_query(tracker.latest_message.get("text") or "")
+        if not query:
+            dispatcher.utter_message(text="Please include the question you want to find matches for.")
+            return []
+
+        try:
+            loop = asyncio.get_running_loop()
+            matches = await loop.run_in_executor(get_search_executor(), self._search, subject, query)
+            if matches is None:
+                dispatcher.utter_message(
+                    text=f"No {subject} papers have been analysed yet. Upload a past paper first."
+                )
+                return []
+
+            lines = []
+            for i, match in enumerate(matches, 1):
+                details = [f"{match['marks']} marks" if match['marks'] is not None else None,
+                           str(match['year']) if match['year'] is not None else match['paper']]
+                lines.append(f"{i}. {match['text']} ({', '.join(d for d in details if d)})")
+            dispatcher.utter_message(
+                text=f"🔎 Similar past {subject} questions:\n" + "\n".join(lines)
+            )
+
+        except Exception as e:
+            logger.exception("Similar question search failed")
+            dispatcher.utter_message(text=f"Search error: {str(e)}")
+
+        return []
+
+    def _search(self, subject: Text, query: Text) -> Optional[List[Dict[Text, Any]]]:
+        """Embed and search; None when the subject has no history yet"""
+        searcher = get_searcher(Config.QUESTION_INDEX_DIR, subject)
+        if not searcher.size:
+            return None
+        return searcher.search(encode_questions([query]), k=Config.SEARCH_TOP_K)
+
+    def _extract_query(self, message: Text) -> Text:
+        """Strip the request phrasing and keep the question itself"""
+        query = re.sub(
+            r"^.*?\b(?:questions?|ones?)\s+(?:like|similar\s+to)\b(?:\s+this(?:\s+one)?)?\s*:?",
+            "", message, flags=re.IGNORECASE
+        )
+        return query.strip(" :\"'")
+
+class ActionGenerateAnalysis(Action):
+    def name(self) -> Text:
+        return "action_generate_analysis"
+
+    async def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+
+        subject = (tracker.get_slot("selected_subject") or "general").lower()
+        try:
+            # Served from precomputed score tables; only a subject's first request touches disk
+            topics = await asyncio.to_thread(get_topic_predictor().predict, subject, Config.PREDICTION_TOP_K)
+            if not topics:
+                dispatcher.utter_message(
+                    text=f"No {subject} papers have been analysed yet. Upload a past paper first."
+                )
+                return []
+
+            lines = []
+            for i, topic in enumerate(topics, 1):
+                history = f"asked in {topic['papers']} paper{'s' if topic['papers'] != 1 else ''}"
+                if topic["last_year"] is not None:
+                    history += f", last in {topic['last_year']}"
+                if len(topic.get("trend", {})) > 1:
+                    recent = list(topic["trend"].items())[-Config.PREDICTION_TREND_YEARS:]
+                    history += "; per year: " + ", ".join(f"{year} ×{questions}" for year, (questions, _) in recent)
+                lines.append(f"{i}. {topic['representative']} ({history})")
+            dispatcher.utter_message(
+                text=f"🔮 Topics most likely to appear in your next {subject} exam:\n" + "\n".join(lines)
+            )
+
+        except Exception as e:
+            logger.exception("Predictive analysis failed")
+            dispatcher.utter_message(text=f"Prediction error: {str(e)}")
+
+        return []
+
+class ActionCreateStudyPlan(Action):
+    def name(self) -> Text:
+        return "action_create_study_plan"
+
+    async def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+
+        subject = (tracker.get_slot("selected_subject") or "general").lower()
+        days = int(tracker.get_slot("study_duration") or 0)
+        if not 1 <= days <= Config.MAX_STUDY_DAYS:
+            dispatcher.utter_message(text=f"Please choose between 1 and {Config.MAX_STUDY_DAYS} days.")
+            return []
+
+        try:
+            # Allocation runs over the subject's cached topic scores, for any number of days
+            plan = await asyncio.to_thread(get_study_planner().plan, subject, days)
+            if plan is None:
+                dispatcher.utter_message(
+                    text=f"No {subject} papers have been analysed yet. Upload a past paper first."
+                )
+                return []
+
+            lines = []
+            for session in plan["sessions"]:
+                span = (f"Day {session['first_day']}" if session["days"] == 1
+                        else f"Days {session['first_day']}-{session['last_day']}")
+                lines.append(f"{span}: {session['topic']}")
+            if plan["revision_days"]:
+                lines.append(f"Last {plan['revision_days']} days: revision and a full mock test")
+            if plan["skipped"]:
+                lines.append(f"If time allows: {'; '.join(plan['skipped'][:3])}")
+            dispatcher.utter_message(
+                text=f"📅 Your {days}-day {subject} study plan:\n" + "\n".join(lines)
+            )
+
+        except Exception as e:
+            logger.exception("Study plan creation failed")
+            dispatcher.utter_message(text=f"Study plan error: {str(e)}")
+
+        return []
+
 # Remaining action classes (StudyPlan, MockTest, etc.) with similar improvements
 # [Include all other action classes from previous version with enhanced error handling]
 
@@ -468,7 +1081,7 @@ class ActionStoreFeedback(Action):
     def name(self) -> Text:
         return "action_store_feedback"
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
@@ -476,11 +1089,14 @@ class ActionStoreFeedback(Action):
         feedback_text = tracker.latest_message.get('text')
         
         # Store feedback with type classification
-        with open("feedback.txt", "a") as f:
-            f.write(f"{datetime.now()} - {feedback_type} - {feedback_text}\n")
+        await asyncio.to_thread(self._append_feedback, f"{datetime.now()} - {feedback_type} - {feedback_text}\n")
         
         return []
 
+    def _append_feedback(self, line: Text):
+        with open("feedback.txt", "a") as f:
+            f.write(line)
+
 # [Include other form validation classes with similar enhancements]
 
 class ValidateStudyPlanForm(FormValidationAction):
@@ -514,4 +1130,21 @@ class ValidateStudyPlanForm(FormValidationAction):
             return {"duration": slot_value}
         else:
             dispatcher.utter_message(text="Please enter a duration between 1 and 12 hours.")
-            return {"duration": None}
\ No newline at end of file
+            return {"duration": None}
+
+    def validate_study_duration(
+        self,
+        slot_value: Any,
+        dispatcher: CollectingDispatcher,
+        tracker: Tracker,
+        domain: Dict[Text, Any]
+    ) -> Dict[Text, Any]:
+        """Validate study_duration slot (days until the exam)."""
+        try:
+            days = int(float(slot_value))
+        except (TypeError, ValueError):
+            days = 0
+        if 1 <= days <= Config.MAX_STUDY_DAYS:
+            return {"study_duration": days}
+        dispatcher.utter_message(text=f"Please enter a number of days between 1 and {Config.MAX_STUDY_DAYS}.")
+        return {"study_duration": None}
@@ -0,0 +1,196 @@
+from typing import Any, Text, Dict, List, Optional, Union
+import os
+import json
+import hashlib
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy import sparse
+from scipy.cluster.hierarchy import fcluster, linkage
+from sklearn.preprocessing import normalize
+
+from clustering import greedy_cluster_labels
+
+logger = logging.getLogger(__name__)
+
+
+class NeighbourGraph:
+    """
+    Scored question pairs sorted by similarity, cut with the same leader clustering
+    the chatbot uses. Any threshold is a prefix of the sorted pairs.
+    """
+
+    kind = "neighbours"
+
+    def __init__(self, n: int, rows: np.ndarray, cols: np.ndarray, similarities: np.ndarray,
+                 stats: Optional[Dict[Text, Any]] = None):
+        order = np.argsort(-similarities, kind="stable")
+        self.n = n
+        self.rows = rows[order]
+        self.cols = cols[order]
+        self.similarities = similarities[order].astype(np.float32)
+        self.stats = stats or {}
+
+    def cut(self, threshold: float) -> np.ndarray:
+        keep = np.searchsorted(-self.similarities, -threshold, side="right")
+        return np.asarray(greedy_cluster_labels(self.n, self.rows[:keep], self.cols[:keep],
+                                                self.similarities[:keep], threshold))
+
+    def arrays(self) -> Dict[Text, np.ndarray]:
+        return {"n": np.array(self.n), "rows": self.rows, "cols": self.cols,
+                "similarities": self.similarities, "stats": np.array(json.dumps(self.stats))}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[Text, np.ndarray]) -> "NeighbourGraph":
+        # Already sorted; the stable argsort leaves the order untouched
+        return cls(int(arrays["n"]), arrays["rows"], arrays["cols"], arrays["similarities"],
+                   json.loads(str(arrays["stats"])))
+
+
+class Dendrogram:
+    """Average-linkage cosine merge tree; a threshold cut matches AgglomerativeClustering"""
+
+    kind = "dendrogram"
+
+    def __init__(self, n: int, merges: np.ndarray):
+        self.n = n
+        self.merges = merges
+        self.stats: Dict[Text, Any] = {}
+
+    @classmethod
+    def build(cls, vectors, block_rows: Optional[int] = None) -> "Dendrogram":
+        """Merge tree of dense or sparse row vectors; see cosine_distances for `block_rows`"""
+        n = vectors.shape[0]
+        if n < 2:
+            return cls(n, np.empty((0, 4)))
+        return cls(n, linkage(cosine_distances(vectors, block_rows), method="average"))
+
+    def cut(self, threshold: float) -> np.ndarray:
+        if self.n < 2:
+            return np.zeros(self.n, dtype=np.int64)
+        # AgglomerativeClustering merges while distance < 1 - threshold
+        distance = np.nextafter(1 - threshold, -np.inf)
+        return fcluster(self.merges, t=distance, criterion="distance") - 1
+
+    def arrays(self) -> Dict[Text, np.ndarray]:
+        return {"n": np.array(self.n), "merges": self.merges}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[Text, np.ndarray]) -> "Dendrogram":
+        return cls(int(arrays["n"]), arrays["merges"])
+
+
+def cosine_distances(vectors, block_rows: Optional[int] = None) -> np.ndarray:
+    """
+    Condensed cosine distances, as pdist(metric="cosine") returns them.
+
+    Computed `block_rows` rows at a time from the (possibly sparse) vectors, so a
+    TF-IDF matrix is never densified and the only n^2 array is the result itself.
+    Rows with no shared vocabulary have undefined cosine; they count as unrelated.
+    """
+    n = vectors.shape[0]
+    unit = normalize(vectors)  # zero rows stay zero, i.e. at distance 1 from everything
+    block_rows = block_rows or n
+    distances = np.empty(n * (n - 1) // 2)
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        similarities = unit[start:stop] @ unit.T
+        similarities = similarities.toarray() if sparse.issparse(similarities) else np.asarray(similarities)
+        for offset, i in enumerate(range(start, stop)):
+            # Row i's pairs (i, i+1..n-1) are contiguous in the condensed layout
+            begin = i * n - i * (i + 1) // 2
+            distances[begin:begin + n - i - 1] = 1.0 - similarities[offset, i + 1:]
+    return np.clip(distances, 0.0, 2.0, out=distances)
+
+
+Hierarchy = Union[NeighbourGraph, Dendrogram]
+_KINDS = {NeighbourGraph.kind: NeighbourGraph, Dendrogram.kind: Dendrogram}
+
+
+def corpus_key(texts: List[Text], *params: Any) -> Text:
+    """Identity of a corpus plus whatever settings shaped its hierarchy"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(repr(params).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class HierarchyCache:
+    """
+    Hierarchies by corpus key: an in-memory LRU, optionally backed by .npz files
+    so other processes and later runs reuse them.
+
+    The directory keeps at most `max_files` files, and none unused for longer than
+    `max_age` seconds; a file's modification time records its last use.
+    """
+
+    def __init__(self, directory: Optional[Text] = None, size: int = 16,
+                 max_files: int = 256, max_age: Optional[float] = None):
+        self.directory = directory
+        self.size = size
+        self.max_files = max_files
+        self.max_age = max_age
+        self._items: "OrderedDict[Text, Hierarchy]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Text) -> Optional[Hierarchy]:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        hierarchy = self._load(key)
+        if hierarchy is not None:
+            self._remember(key, hierarchy)
+        return hierarchy
+
+    def put(self, key: Text, hierarchy: Hierarchy):
+        self._remember(key, hierarchy)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = os.path.join(self.directory, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+            np.savez(temp_path, kind=np.array(hierarchy.kind), **hierarchy.arrays())
+            os.replace(temp_path, os.path.join(self.directory, f"{key}.npz"))
+            self._prune()
+
+    def _load(self, key: Text) -> Optional[Hierarchy]:
+        if not self.directory:
+            return None
+        path = os.path.join(self.directory, f"{key}.npz")
+        try:
+            if self.max_age is not None and time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            os.utime(path)  # mark as used, so pruning removes the least recently used first
+            with np.load(path) as arrays:
+                return _KINDS[str(arrays["kind"])].from_arrays(dict(arrays))
+        except FileNotFoundError:  # never written, or pruned by another process
+            return None
+
+    def _prune(self):
+        files = []
+        for entry in os.listdir(self.directory):
+            if entry.endswith(".npz") and ".tmp" not in entry:
+                path = os.path.join(self.directory, entry)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        files.sort(reverse=True)
+        now = time.time()
+        for rank, (last_used, path) in enumerate(files):
+            if rank >= self.max_files or (self.max_age is not None and now - last_used > self.max_age):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _remember(self, key: Text, hierarchy: Hierarchy):
+        with self._lock:
+            self._items[key] = hierarchy
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
@@ -0,0 +1,130 @@
+from typing import Any, Text, Dict, List, Optional, Tuple
+import logging
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+logger = logging.getLogger(__name__)
+
+
+def candidate_pairs(texts: List[Text],
+                    min_similarity: float = 0.1,
+                    top_k: Optional[int] = 20,
+                    analyzer: Text = 'word',
+                    block_size: int = 1024) -> Tuple[np.ndarray, np.ndarray, Dict[Text, Any]]:
+    """
+    Propose likely-duplicate question pairs using TF-IDF blocking.
+
+    Only pairs whose TF-IDF cosine is at least `min_similarity` are kept, and each
+    question keeps at most `top_k` neighbours (None keeps all of them). Lowering
+    `min_similarity` or raising `top_k` trades speed for recall; `analyzer='char_wb'`
+    also catches spelling and inflection variants that share no whole word.
+    Returns (rows, cols, stats) with rows[k] < cols[k] for every pair.
+    """
+    n = len(texts)
+    total = n * (n - 1) // 2
+    empty = np.empty(0, dtype=np.int64)
+
+    try:
+        if analyzer == 'word':
+            vectorizer = TfidfVectorizer(stop_words='english')
+        else:
+            vectorizer = TfidfVectorizer(analyzer=analyzer, ngram_range=(3, 5))
+        X = vectorizer.fit_transform(texts)
+    except ValueError:
+        # Empty vocabulary (e.g. only stop words): nothing can be blocked together
+        return empty, empty, _candidate_stats(total, 0)
+
+    rows, cols, _ = similar_pairs(X, min_similarity, top_k, block_size)
+    stats = _candidate_stats(total, len(rows))
+    logger.info("Candidate generation scored %d of %d pairs (%d avoided)",
+                stats["scored_pairs"], stats["total_pairs"], stats["avoided_pairs"])
+    return rows, cols, stats
+
+
+def similar_pairs(X, min_similarity: float = 0.1, top_k: Optional[int] = None,
+                  block_size: int = 1024) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pairs of rows of an L2-normalised sparse matrix with cosine at least `min_similarity`.
+
+    The product is taken `block_size` rows at a time, so memory follows the block and
+    the shared vocabulary rather than n^2. Returns (rows, cols, similarities) with
+    rows[k] < cols[k]; each row keeps at most `top_k` neighbours (None keeps all).
+    """
+    n = X.shape[0]
+    rows, cols, sims = [], [], []
+    for start in range(0, n, block_size):
+        # Sparse product keeps memory proportional to shared vocabulary, not n^2
+        block = (X[start:start + block_size] @ X.T).tocsr()
+        for offset in range(block.shape[0]):
+            i = start + offset
+            lo, hi = block.indptr[offset], block.indptr[offset + 1]
+            neighbours = block.indices[lo:hi]
+            scores = block.data[lo:hi]
+            keep = (neighbours != i) & (scores >= min_similarity)
+            neighbours, scores = neighbours[keep], scores[keep]
+            if top_k is not None and len(neighbours) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                neighbours, scores = neighbours[best], scores[best]
+            rows.append(np.minimum(neighbours, i))
+            cols.append(np.maximum(neighbours, i))
+            sims.append(scores)
+
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    # A pair can be proposed from both ends (with the same score); keep each one once
+    pairs, first = np.unique(np.stack([np.concatenate(rows), np.concatenate(cols)], axis=1),
+                             axis=0, return_index=True)
+    return (pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.int64),
+            np.concatenate(sims)[first].astype(np.float32))
+
+
+def _candidate_stats(total: int, scored: int) -> Dict[Text, Any]:
+    return {
+        "total_pairs": total,
+        "scored_pairs": scored,
+        "avoided_pairs": total - scored,
+        "avoided_ratio": (total - scored) / total if total else 0.0
+    }
+
+
+def pair_similarities(embeddings: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+                      block_size: Optional[int] = None) -> np.ndarray:
+    """Cosine similarity for the given pairs only, gathered `block_size` pairs at a time"""
+    similarities = np.empty(len(rows), dtype=np.float32)
+    block_size = block_size or max(len(rows), 1)
+    for start in range(0, len(rows), block_size):
+        stop = start + block_size
+        # Gather pairs before normalising so a shared (possibly float16) matrix is never copied whole
+        left = embeddings[rows[start:stop]].astype(np.float32)
+        right = embeddings[cols[start:stop]].astype(np.float32)
+        norms = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+        similarities[start:stop] = np.einsum('ij,ij->i', left, right) / np.where(norms == 0, 1, norms)
+    return similarities
+
+
+def greedy_cluster_labels(n: int, rows: np.ndarray, cols: np.ndarray,
+                          similarities: np.ndarray, threshold: float = 0.8) -> List[int]:
+    """
+    Leader clustering over a sparse set of scored pairs.
+
+    Matches the dense version: questions are visited in order and each unvisited
+    question pulls every later unvisited neighbour at or above `threshold` into its cluster.
+    """
+    keep = similarities >= threshold
+    rows, cols = rows[keep], cols[keep]
+    order = np.lexsort((cols, rows))
+    rows, cols = rows[order], cols[order]
+    starts = np.searchsorted(rows, np.arange(n + 1))
+
+    labels = [-1] * n
+    cluster_id = 0
+    for i in range(n):
+        if labels[i] != -1:
+            continue
+        labels[i] = cluster_id
+        for j in cols[starts[i]:starts[i + 1]]:
+            if labels[j] == -1:
+                labels[j] = cluster_id
+        cluster_id += 1
+    return labels
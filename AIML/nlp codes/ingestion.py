@@ -0,0 +1,251 @@
+from typing import Any, Text, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import os
+import re
+import time
+import zipfile
+import logging
+import xml.etree.ElementTree as ET
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from ocr import OcrPage, fill_missing_pages
+
+try:
+    import fitz  # PyMuPDF: C text extraction, several times faster than PyPDF2
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+PDF = "pdf"
+DOCX = "docx"
+
+PDF_MAGIC = b"%PDF-"
+ZIP_MAGIC = b"PK\x03\x04"
+DOCX_PART = "word/document.xml"
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+# iter_pages: PDF pages read (and OCRed) per step, and DOCX paragraphs per yielded page
+PDF_PAGES_PER_CHUNK = 16
+DOCX_PARAGRAPHS_PER_PAGE = 200
+
+
+class IngestionResult(NamedTuple):
+    path: Text
+    file_format: Optional[Text]
+    pages: List[Text]
+    size: int
+    seconds: float
+    error: Optional[Text] = None
+    ocr: Tuple[OcrPage, ...] = ()  # pages that had no text layer and were recognised
+
+    @property
+    def text(self) -> Text:
+        return " ".join(self.pages)
+
+
+def detect_format(path: Text) -> Text:
+    """Identify a document by its leading bytes rather than its file name"""
+    with open(path, "rb") as f:
+        head = f.read(1024)
+    if head.startswith(ZIP_MAGIC):
+        with zipfile.ZipFile(path) as archive:
+            if DOCX_PART in archive.namelist():
+                return DOCX
+    elif PDF_MAGIC in head:  # some producers put junk before the header
+        return PDF
+    raise ValueError("Unsupported file type (expected a PDF or DOCX document)")
+
+
+def extract_pages(path: Text, file_format: Optional[Text] = None,
+                  ocr_workers: Optional[int] = None) -> List[Text]:
+    """
+    Text per page (a DOCX is a single page of newline-separated paragraphs).
+
+    PDF pages without a text layer are OCRed when an engine is installed.
+    """
+    return _extract(path, file_format, ocr_workers)[0]
+
+
+def iter_pages(path: Text, file_format: Optional[Text] = None,
+               ocr_workers: Optional[int] = None) -> Iterator[Text]:
+    """
+    Text per page, extracted only as the caller consumes it.
+
+    A caller that stops early never reads (or OCRs) the rest of the document. PDF
+    pages are read a chunk at a time so pages without a text layer are still OCRed
+    in parallel; a DOCX comes as groups of newline-separated paragraphs.
+    """
+    file_format = file_format or detect_format(path)
+    if file_format == PDF:
+        chunk: List[Text] = []
+        first_page = 0
+        for text in _iter_pdf_pages(path):
+            chunk.append(text)
+            if len(chunk) == PDF_PAGES_PER_CHUNK:
+                fill_missing_pages(path, chunk, max_workers=ocr_workers, first_page=first_page)
+                yield from chunk
+                first_page += len(chunk)
+                chunk = []
+        if chunk:
+            fill_missing_pages(path, chunk, max_workers=ocr_workers, first_page=first_page)
+            yield from chunk
+        return
+    group: List[Text] = []
+    for paragraph in _iter_docx_paragraphs(path):
+        group.append(paragraph)
+        if len(group) == DOCX_PARAGRAPHS_PER_PAGE:
+            yield "\n".join(group)
+            group = []
+    if group:
+        yield "\n".join(group)
+
+
+def extract_text(path: Text) -> Text:
+    return " ".join(extract_pages(path))
+
+
+def leading_text(pages: List[Text], chars: int = 2000) -> Text:
+    """First `chars` characters of the joined pages, without joining the whole document"""
+    head, length = [], 0
+    for page in pages:
+        if length >= chars:
+            break
+        head.append(page)
+        length += len(page) + 1
+    return " ".join(head)[:chars]
+
+
+def paper_year(name: Text, text: Text = "") -> Optional[int]:
+    """
+    Exam year of a paper: a year in the file name, else an exam session such as
+    "May 2019" or "Nov/Dec 2022" near the top of the paper (syllabus "2019 Pattern" is ignored)
+    """
+    match = re.search(r"(?<!\d)((?:19|20)\d{2})(?!\d)", os.path.basename(name))
+    if match:
+        return int(match.group(1))
+    sessions = re.findall(
+        r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?(?:\s*[/-]\s*[a-z]+\.?)?[\s,-]*((?:19|20)\d{2})\b",
+        text[:2000], flags=re.IGNORECASE)
+    return max(int(y) for y in sessions) if sessions else None
+
+
+def _extract(path: Text, file_format: Optional[Text],
+             ocr_workers: Optional[int]) -> Tuple[List[Text], List[OcrPage]]:
+    file_format = file_format or detect_format(path)
+    if file_format == PDF:
+        pages = _pdf_pages(path)
+        return pages, fill_missing_pages(path, pages, max_workers=ocr_workers)
+    return ["\n".join(_docx_paragraphs(path))], []
+
+
+def _docx_paragraphs(path: Text) -> List[Text]:
+    return list(_iter_docx_paragraphs(path))
+
+
+def _iter_docx_paragraphs(path: Text) -> Iterator[Text]:
+    """
+    Stream word/document.xml instead of building the python-docx object model.
+
+    Paragraphs can nest (a text box inside a paragraph holds paragraphs of its own),
+    so each open paragraph collects its own text and keeps its place in document
+    order; they are yielded as each top-level paragraph closes. The legacy copy of a
+    text box in mc:Fallback is skipped, since the mc:Choice copy was already read.
+    """
+    paragraphs: List[Optional[Text]] = []
+    open_paragraphs: List[Tuple[int, List[Text]]] = []
+    fallback_depth = 0
+    with zipfile.ZipFile(path) as archive, archive.open(DOCX_PART) as document:
+        for event, elem in ET.iterparse(document, events=("start", "end")):
+            if elem.tag == _MC_FALLBACK:
+                fallback_depth += 1 if event == "start" else -1
+            elif fallback_depth:
+                continue
+            elif event == "start":
+                if elem.tag == _W + "p":
+                    open_paragraphs.append((len(paragraphs), []))
+                    paragraphs.append(None)
+            elif elem.tag == _W + "t" and open_paragraphs:
+                open_paragraphs[-1][1].append(elem.text or "")
+            elif elem.tag in (_W + "tab", _W + "br", _W + "cr") and open_paragraphs:
+                open_paragraphs[-1][1].append(" ")
+            elif elem.tag == _W + "p":
+                slot, parts = open_paragraphs.pop()
+                paragraphs[slot] = "".join(parts)
+                if not open_paragraphs:
+                    elem.clear()
+                    yield from paragraphs
+                    paragraphs.clear()
+
+
+def _pdf_pages(path: Text) -> List[Text]:
+    return list(_iter_pdf_pages(path))
+
+
+def _iter_pdf_pages(path: Text) -> Iterator[Text]:
+    if fitz is not None:
+        with fitz.open(path) as document:
+            for page in document:
+                yield page.get_text()
+        return
+    # Not pdfplumber (the batch analyzer's original reader): on question papers it gives
+    # the same lines as PyPDF2 but is about 100x slower, since pdfminer lays out every glyph
+    import PyPDF2
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        for page in reader.pages:
+            yield page.extract_text() or ""
+
+
+def _ingest_one(path: Text, ocr_workers: Optional[int] = None) -> IngestionResult:
+    start = time.perf_counter()
+    file_format = None
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    try:
+        file_format = detect_format(path)
+        pages, ocr = _extract(path, file_format, ocr_workers)
+        return IngestionResult(path, file_format, pages, size, time.perf_counter() - start, ocr=tuple(ocr))
+    except Exception as e:
+        return IngestionResult(path, file_format, [], size, time.perf_counter() - start, str(e))
+
+
+def ingest_many(paths: List[Text], max_workers: Optional[int] = None) -> List[IngestionResult]:
+    """
+    Extract several uploads concurrently, one process per document.
+
+    Results come back in input order; a document that fails carries its error
+    instead of aborting the batch.
+    """
+    if len(paths) <= 1 or max_workers == 1:
+        results = [_ingest_one(path) for path in paths]
+    else:
+        # Documents are already spread over processes; OCR within each stays serial
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(partial(_ingest_one, ocr_workers=1), paths))
+    for fmt, stats in throughput_by_format(results).items():
+        logger.info("Ingested %d %s files at %.2f MB/s (%.1f files/s)",
+                    stats["files"], fmt, stats["mb_per_second"], stats["files_per_second"])
+    ocr = [page for result in results for page in result.ocr]
+    if ocr:
+        logger.info("OCRed %d scanned pages (%d from cache) in %.1fs of page time",
+                    len(ocr), sum(page.cached for page in ocr), sum(page.seconds for page in ocr))
+    return results
+
+
+def throughput_by_format(results: List[IngestionResult]) -> Dict[Text, Dict[Text, Any]]:
+    """Per-format file count, volume and extraction rate"""
+    summary: Dict[Text, Dict[Text, Any]] = {}
+    for result in results:
+        if result.error is not None:
+            continue
+        stats = summary.setdefault(result.file_format, {"files": 0, "bytes": 0, "seconds": 0.0})
+        stats["files"] += 1
+        stats["bytes"] += result.size
+        stats["seconds"] += result.seconds
+    for stats in summary.values():
+        seconds = stats["seconds"] or 1e-9
+        stats["mb_per_second"] = stats["bytes"] / 1024 / 1024 / seconds
+        stats["files_per_second"] = stats["files"] / seconds
+    return summary
+
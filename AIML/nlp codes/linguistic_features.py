@@ -0,0 +1,91 @@
+from typing import Any, Iterable, Text, Dict, List, NamedTuple
+import logging
+from collections import Counter
+
+from models import get_nlp
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 256
+MIN_TEXTS_PER_PROCESS = 2000  # below this, starting worker processes costs more than it saves
+
+
+class QuestionFeatures(NamedTuple):
+    command_verbs: List[Text]  # what the question asks the student to do, e.g. ["define", "explain"]
+    topics: List[Text]  # noun phrases without stop words
+    sentences: int
+
+
+def question_features(texts: Iterable[Text], batch_size: int = BATCH_SIZE, n_process: int = 1,
+                      nlp=None) -> List[QuestionFeatures]:
+    """Features of every question from one batched nlp.pipe pass"""
+    nlp = nlp or get_nlp()
+    texts = list(texts)
+    if n_process > 1 and len(texts) < n_process * MIN_TEXTS_PER_PROCESS:
+        n_process = 1
+    return [_features(doc) for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+
+
+def summarise(features: List[QuestionFeatures], top_n: int = 5) -> Dict[Text, Any]:
+    """Most common command verbs and topics of a paper, for reports and classifiers"""
+    verbs = Counter(verb for f in features for verb in f.command_verbs)
+    topics = Counter(topic for f in features for topic in f.topics)
+    return {
+        "command_verbs": verbs.most_common(top_n),
+        "topics": topics.most_common(top_n),
+        "avg_sentences": round(sum(f.sentences for f in features) / len(features), 2) if features else 0.0
+    }
+
+
+def _features(doc) -> QuestionFeatures:
+    if not doc.has_annotation("DEP"):
+        # No parser in the pipeline: verbs and noun chunks need the parse
+        return QuestionFeatures([], [], 1 if len(doc) else 0)
+    verbs, sentences = [], 0
+    for sentence in doc.sents:
+        sentences += 1
+        root = sentence.root
+        # Imperatives have no subject: "Explain paging", not "Paging explains ..."
+        if root.pos_ == "VERB" and not any(c.dep_ in ("nsubj", "nsubjpass") for c in root.children):
+            verbs.append(root.lower_)
+            # "Define and explain ...": both verbs are asked for
+            verbs.extend(c.lower_ for c in root.children if c.dep_ == "conj" and c.pos_ == "VERB")
+    topics = []
+    for chunk in doc.noun_chunks:
+        words = [t.lower_ for t in chunk if not (t.is_stop or t.is_punct)]
+        if words:
+            topics.append(" ".join(words))
+    return QuestionFeatures(list(dict.fromkeys(verbs)), list(dict.fromkeys(topics)), sentences)
+
+
+if __name__ == "__main__":
+    # Throughput benchmark: per-question nlp(text) on the full pipeline versus one
+    # batched nlp.pipe pass over the trimmed pipeline
+    import sys
+    import time
+    import random
+    import spacy
+    from models import SPACY_MODEL_NAME
+
+    stems = ["Explain", "Define and explain", "Compare", "Describe with a suitable example",
+             "Differentiate between", "List the features of", "Calculate the", "What is"]
+    topics = ["process scheduling", "virtual memory", "the banker's algorithm", "page replacement policies",
+              "a deadlock", "semaphores and monitors", "the file allocation table", "thread synchronisation"]
+    rng = random.Random(0)
+    texts = [f"{rng.choice(stems)} {rng.choice(topics)}. {rng.choice(stems)} {rng.choice(topics)}."
+             for _ in range(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)]
+
+    full = spacy.load(SPACY_MODEL_NAME)
+    start = time.perf_counter()
+    for text in texts:
+        _features(full(text))
+    per_question = time.perf_counter() - start
+
+    trimmed = get_nlp()
+    start = time.perf_counter()
+    question_features(texts, nlp=trimmed)
+    batched = time.perf_counter() - start
+
+    print(f"full pipeline, nlp(text):   {len(texts) / per_question:8.0f} questions/s ({full.pipe_names})")
+    print(f"trimmed pipeline, nlp.pipe: {len(texts) / batched:8.0f} questions/s ({trimmed.pipe_names})")
+    print(f"speed-up:                   {per_question / batched:8.1f}x")
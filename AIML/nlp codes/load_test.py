@@ -0,0 +1,437 @@
+"""
+Load generator for the action server webhook.
+
+Plays the part of Rasa core: builds the tracker payloads Rasa would send for each
+action (synthetic exam papers for uploads and analyses) and posts them straight to
+the webhook, so no Rasa server is needed. Two arrival models:
+
+- closed loop: N virtual users, each sending its next request after the previous
+  response and a think time, so load adapts to how fast the server answers
+- open loop: Poisson arrivals at a fixed rate whatever the response times, which
+  shows queueing and shedding once the rate exceeds capacity
+
+    python load_test.py --users 20 --duration 60
+    python load_test.py --rate 15 --duration 60 --mix analysis=1,search=4
+    python load_test.py --serve 4 --users 50 --json results/load.json
+
+--serve starts prefork.py workers for the run. The server reads uploaded papers from
+disk, so it has to run on this machine (or share --paper-dir).
+"""
+from typing import Any, Text, Dict, List, Optional, Tuple
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import zipfile
+import argparse
+import subprocess
+from collections import defaultdict
+from urllib.parse import urlsplit
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = "http://localhost:5055/webhook"  # action_endpoint in endpoints.yml
+# Relative request frequency per scenario; roughly what a busy evening of students looks like
+DEFAULT_MIX = {
+    "navigation": 4,
+    "small_talk": 3,
+    "mock_test": 3,
+    "search": 3,
+    "prediction": 2,
+    "study_plan": 2,
+    "upload": 1,
+    "analysis": 1
+}
+SCENARIO_ACTIONS = {
+    "navigation": "action_handle_navigation",
+    "small_talk": "action_handle_small_talk",
+    "mock_test": "action_generate_mock_test",
+    "search": "action_search_similar_questions",
+    "prediction": "action_generate_analysis",
+    "study_plan": "action_create_study_plan",
+    "upload": "action_handle_file_upload",
+    "analysis": "action_analyze_question_paper"
+}
+PAGES = ["study materials", "practice tests", "analysis reports", "account settings", "forum"]
+SMALL_TALK = ["hello", "how are you", "tell me something"]
+# Replies that mean the request was turned away or failed even though HTTP said 200
+_SHED = re.compile(r"handling a lot of requests", re.IGNORECASE)
+_FAILED = re.compile(r"\berror\b|failed to", re.IGNORECASE)
+
+_WORDS = ("process thread deadlock paging segmentation scheduling semaphore monitor cache "
+          "virtual memory file system interrupt kernel mutex starvation fragmentation "
+          "page replacement algorithm disk inode buffer pipeline").split()
+_STEMS = ["Explain", "Define", "Compare", "Describe with example", "What is", "Calculate",
+          "Differentiate between", "List the features of", "Write short note on"]
+
+
+def synthetic_paper(path: Text, seed: int, questions: int = 12):
+    """A small DOCX exam paper with numbered questions, marks and an exam session"""
+    rng = random.Random(seed)
+    lines = [f"Operating Systems End Semester Examination "
+             f"{rng.choice(['May', 'Nov/Dec'])} {rng.randint(2015, 2024)}"]
+    for number in range(1, questions + 1):
+        topic = " ".join(rng.sample(_WORDS, rng.randint(2, 4)))
+        lines.append(f"Q{number}. {rng.choice(_STEMS)} {topic}. [{rng.choice((4, 5, 6, 8, 10))}]")
+    body = "".join(f"<w:p><w:r><w:t>{line}</w:t></w:r></w:p>" for line in lines)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml",
+                      '<?xml version="1.0" encoding="UTF-8"?>'
+                      '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                      '<Default Extension="xml" ContentType="application/xml"/>'
+                      '<Override PartName="/word/document.xml" ContentType="application/'
+                      'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/></Types>')
+        docx.writestr("word/document.xml",
+                      '<?xml version="1.0" encoding="UTF-8"?>'
+                      '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                      f'<w:body>{body}</w:body></w:document>')
+
+
+class PayloadFactory:
+    """Webhook requests for each scenario, as Rasa core would send them"""
+
+    def __init__(self, paper_dir: Text, papers: int = 20, subject: Text = "loadtest", seed: int = 0):
+        self.subject = subject
+        self.rng = random.Random(seed)
+        os.makedirs(paper_dir, exist_ok=True)
+        # A small pool means repeat uploads (digest cache hits); a large one means fresh analyses
+        self.papers = []
+        for i in range(papers):
+            path = os.path.abspath(os.path.join(paper_dir, f"paper_{seed}_{i}.docx"))
+            if not os.path.exists(path):
+                synthetic_paper(path, seed * 100003 + i)
+            self.papers.append(path)
+
+    def build(self, scenario: Text, sender: Text) -> Dict[Text, Any]:
+        slots: Dict[Text, Any] = {"selected_subject": self.subject}
+        text, entities = "", []
+        if scenario == "navigation":
+            page = self.rng.choice(PAGES)
+            text, entities = f"take me to {page}", [{"entity": "page", "value": page}]
+        elif scenario == "small_talk":
+            text = self.rng.choice(SMALL_TALK)
+        elif scenario == "mock_test":
+            slots.update(selected_subject=self.rng.choice(["math", "physics"]),
+                         question_count=self.rng.randint(1, 5), difficulty_level="easy", time_limit="30")
+        elif scenario == "search":
+            text = f"find questions like {self.rng.choice(_STEMS)} {' '.join(self.rng.sample(_WORDS, 2))}"
+        elif scenario == "study_plan":
+            slots["study_duration"] = self.rng.randint(7, 60)
+        elif scenario in ("upload", "analysis"):
+            slots["uploaded_file"] = self.rng.choice(self.papers)
+        return {
+            "next_action": SCENARIO_ACTIONS[scenario],
+            "sender_id": sender,
+            "tracker": {
+                "sender_id": sender,
+                "slots": slots,
+                "latest_message": {"text": text, "intent": {}, "entities": entities},
+                "events": [],
+                "paused": False,
+                "followup_action": None,
+                "active_loop": {},
+                "latest_action_name": "action_listen"
+            },
+            "domain": {},
+            "version": "3.0.0"
+        }
+
+
+class _Connection:
+    """Keep-alive HTTP/1.1 connection; just enough client for JSON requests to one server"""
+
+    def __init__(self, host: Text, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: Text, path: Text, body: bytes = b"") -> Tuple[int, bytes]:
+        reused = self.writer is not None
+        try:
+            return await self._request(method, path, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            # A reset keep-alive connection is retried once on a fresh one, but only for requests
+            # safe to repeat: a POST may already have been processed and would be counted twice
+            if not reused or method not in ("GET", "HEAD"):
+                raise
+            return await self._request(method, path, body)
+
+    async def _request(self, method: Text, path: Text, body: bytes) -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                          f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                          + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed the connection")
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            payload = await self._read_chunked()
+        else:
+            payload = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return int(status_line.split()[1]), payload
+
+    async def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await self.reader.readline()
+                return b"".join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class LoadStats:
+    """Latency and outcome of every request, reported per action"""
+
+    OUTCOMES = ("ok", "shed", "error", "timeout", "dropped")
+
+    def __init__(self):
+        self.latencies: Dict[Text, List[float]] = defaultdict(list)
+        self.outcomes: Dict[Text, Dict[Text, int]] = defaultdict(lambda: dict.fromkeys(self.OUTCOMES, 0))
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, action: Text, outcome: Text, seconds: Optional[float] = None):
+        self.outcomes[action][outcome] += 1
+        if seconds is not None:
+            self.latencies[action].append(seconds)
+
+    def report(self) -> Dict[Text, Dict[Text, Any]]:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        rows = {action: self._row(self.latencies[action], counts, elapsed)
+                for action, counts in sorted(self.outcomes.items())}
+        total = dict.fromkeys(self.OUTCOMES, 0)
+        for counts in self.outcomes.values():
+            for outcome, count in counts.items():
+                total[outcome] += count
+        rows["total"] = self._row([s for values in self.latencies.values() for s in values], total, elapsed)
+        return rows
+
+    @staticmethod
+    def _row(latencies: List[float], counts: Dict[Text, int], elapsed: float) -> Dict[Text, Any]:
+        sent = sum(counts.values())
+        ms = np.asarray(latencies) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+        return dict(
+            counts,
+            sent=sent,
+            error_rate=round((sent - counts["ok"]) / sent, 4) if sent else 0.0,
+            throughput=round(counts["ok"] / elapsed, 2) if elapsed else 0.0,  # successful requests/s
+            p50_ms=round(float(p50), 1),
+            p95_ms=round(float(p95), 1),
+            p99_ms=round(float(p99), 1),
+            max_ms=round(float(ms.max()), 1) if len(ms) else 0.0
+        )
+
+
+class LoadGenerator:
+    def __init__(self, url: Text, factory: PayloadFactory, mix: Dict[Text, float],
+                 timeout: float = 330.0, seed: int = 0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 80
+        self.path = parts.path or "/webhook"
+        self.factory = factory
+        self.scenarios = list(mix)
+        self.weights = [mix[s] for s in self.scenarios]
+        self.timeout = timeout  # above ANALYSIS_TIMEOUT, so a slow analysis is not cut short here
+        self.rng = random.Random(seed)
+        self.stats = LoadStats()
+
+    async def closed_loop(self, users: int, duration: float, think: float = 1.0) -> LoadStats:
+        """`users` virtual users, each waiting for its reply plus an exponential think time"""
+        deadline = time.perf_counter() + duration
+
+        async def user(number: int):
+            connection = _Connection(self.host, self.port)
+            try:
+                while time.perf_counter() < deadline:
+                    await self._send(connection, f"loadtest-user-{number}")
+                    if think:
+                        await asyncio.sleep(self.rng.expovariate(1 / think))
+            finally:
+                connection.close()
+
+        self.stats = LoadStats()
+        await asyncio.gather(*(user(i) for i in range(users)))
+        self.stats.finished = time.perf_counter()
+        return self.stats
+
+    async def open_loop(self, rate: float, duration: float, max_in_flight: int = 1000) -> LoadStats:
+        """Poisson arrivals at `rate` per second; arrivals beyond `max_in_flight` are dropped"""
+        idle: List[_Connection] = []
+        in_flight = set()
+
+        async def arrival(sender: Text):
+            connection = idle.pop() if idle else _Connection(self.host, self.port)
+            try:
+                await self._send(connection, sender)
+            finally:
+                idle.append(connection)
+
+        self.stats = LoadStats()
+        deadline = time.perf_counter() + duration
+        sent = 0
+        while True:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            if time.perf_counter() >= deadline:
+                break
+            sent += 1
+            if len(in_flight) >= max_in_flight:
+                self.stats.record(SCENARIO_ACTIONS[self._scenario()], "dropped")
+                continue
+            # Each arrival is a new conversation, as with many independent students
+            task = asyncio.ensure_future(arrival(f"loadtest-{sent}"))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        self.stats.finished = time.perf_counter()
+        for connection in idle:
+            connection.close()
+        return self.stats
+
+    def _scenario(self) -> Text:
+        return self.rng.choices(self.scenarios, self.weights)[0]
+
+    async def _send(self, connection: _Connection, sender: Text):
+        payload = self.factory.build(self._scenario(), sender)
+        action = payload["next_action"]
+        body = json.dumps(payload).encode()
+        start = time.perf_counter()
+        try:
+            status, reply = await asyncio.wait_for(connection.request("POST", self.path, body), self.timeout)
+        except asyncio.TimeoutError:
+            connection.close()
+            self.stats.record(action, "timeout", time.perf_counter() - start)
+            return
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            connection.close()
+            logger.debug("%s failed: %s", action, e)
+            self.stats.record(action, "error", time.perf_counter() - start)
+            return
+        self.stats.record(action, _outcome(status, reply), time.perf_counter() - start)
+
+
+def _outcome(status: int, reply: bytes) -> Text:
+    if status != 200:
+        return "error"
+    texts = [r.get("text") or "" for r in json.loads(reply).get("responses", [])]
+    if any(_SHED.search(t) for t in texts):
+        return "shed"
+    if any(_FAILED.search(t) for t in texts):
+        return "error"
+    return "ok"
+
+
+def parse_mix(spec: Optional[Text]) -> Dict[Text, float]:
+    """'analysis=1,search=4' -> weights; scenarios not listed are not sent"""
+    if not spec:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIO_ACTIONS:
+            raise ValueError(f"Unknown scenario {name.strip()!r}; choose from {', '.join(SCENARIO_ACTIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def format_report(report: Dict[Text, Dict[Text, Any]]) -> Text:
+    columns = ["sent", "ok", "shed", "error", "timeout", "dropped", "error_rate",
+               "throughput", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    width = max(len(action) for action in report)
+    lines = [f"{'action':<{width}} " + " ".join(f"{c:>10}" for c in columns)]
+    for action, row in report.items():
+        lines.append(f"{action:<{width}} " + " ".join(f"{row[c]:>10}" for c in columns))
+    return "\n".join(lines)
+
+
+def start_server(workers: int, port: int, startup_timeout: float = 300.0) -> subprocess.Popen:
+    """Run prefork.py alongside the generator and wait until it answers /health"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen([sys.executable, os.path.join(here, "prefork.py"),
+                               "--workers", str(workers), "--port", str(port)], cwd=here)
+
+    async def healthy() -> bool:
+        connection = _Connection("127.0.0.1", port)
+        try:
+            status, _ = await connection.request("GET", "/health")
+            return status == 200
+        except OSError:
+            return False
+        finally:
+            connection.close()
+
+    deadline = time.monotonic() + startup_timeout
+    while not asyncio.run(healthy()):
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.terminate()
+            raise RuntimeError("Action server did not start")
+        time.sleep(1)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the action server webhook without Rasa core")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of load")
+    arrivals = parser.add_mutually_exclusive_group()
+    arrivals.add_argument("--users", type=int, default=10, help="closed loop: concurrent virtual users")
+    arrivals.add_argument("--rate", type=float, help="open loop: Poisson arrivals per second")
+    parser.add_argument("--think", type=float, default=1.0, help="closed loop: mean think time in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="open loop: client-side cap")
+    parser.add_argument("--mix", help="scenario weights, e.g. navigation=4,analysis=1")
+    parser.add_argument("--papers", type=int, default=20, help="synthetic papers to upload and analyse")
+    parser.add_argument("--paper-dir", default="load_test_papers")
+    parser.add_argument("--subject", default="loadtest", help="keeps load-test papers out of real subjects")
+    parser.add_argument("--timeout", type=float, default=330.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serve", type=int, metavar="WORKERS", help="start prefork.py with this many workers")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = start_server(args.serve, urlsplit(args.url).port or 5055) if args.serve else None
+    try:
+        factory = PayloadFactory(args.paper_dir, papers=args.papers, subject=args.subject, seed=args.seed)
+        generator = LoadGenerator(args.url, factory, parse_mix(args.mix), timeout=args.timeout, seed=args.seed)
+        if args.rate:
+            stats = asyncio.run(generator.open_loop(args.rate, args.duration, args.max_in_flight))
+        else:
+            stats = asyncio.run(generator.closed_loop(args.users, args.duration, args.think))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = stats.report()
+    print(format_report(report))
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,91 @@
+from typing import Text, List, Optional
+import os
+import sys
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class MemoryBudget:
+    """
+    Memory allowance for one analysis.
+
+    Stages estimate their footprint from input size and ask `fits`; stages that can
+    work in blocks ask `block_rows` for a block size. Every switch to a cheaper
+    algorithm is recorded in `adaptations`. A limit of None never constrains anything.
+    """
+
+    def __init__(self, limit: Optional[int] = None, block_share: float = 0.25):
+        self.limit = limit
+        self.block_share = block_share  # one block may use this share of the budget
+        self.adaptations: List[Text] = []
+
+    def fits(self, nbytes: int) -> bool:
+        return self.limit is None or nbytes <= self.limit
+
+    def block_rows(self, bytes_per_row: int, cap: Optional[int] = None) -> int:
+        """Rows per block so a block stays within its share of the budget"""
+        if self.limit is None:
+            return cap or 1 << 30
+        rows = max(1, int(self.limit * self.block_share) // max(bytes_per_row, 1))
+        return min(rows, cap) if cap else rows
+
+    def note(self, stage: Text, message: Text):
+        self.adaptations.append(f"{stage}: {message}")
+        logger.info("Memory budget (%s MB) - %s: %s",
+                    "unlimited" if self.limit is None else self.limit // MB, stage, message)
+
+
+def resident_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    # No procfs: fall back to the lifetime peak, the best available figure
+    try:
+        import resource  # POSIX only
+    except ImportError:
+        return 0  # Windows: no figure, peaks read as zero
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB elsewhere
+
+
+class PeakMemory:
+    """
+    Samples resident memory in the background while a run is in progress.
+
+    The figure is process-wide, so concurrent analyses in the same worker inflate
+    each other's peaks; work offloaded to another process is not included.
+    """
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "PeakMemory":
+        self.start = self.peak = resident_bytes()
+        self._thread = threading.Thread(target=self._sample, name="peak-memory", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, resident_bytes())
+
+    @property
+    def growth(self) -> int:
+        """Peak above the resident size at the start of the run"""
+        return self.peak - self.start
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, resident_bytes())
@@ -0,0 +1,35 @@
+from typing import Text, List
+from functools import lru_cache
+import numpy as np
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+SPACY_MODEL_NAME = 'en_core_web_sm'
+# The feature stage only reads POS tags and the dependency parse (verbs, noun chunks, sentences)
+SPACY_EXCLUDE = ['ner', 'lemmatizer']
+
+
+@lru_cache(maxsize=None)
+def get_nlp():
+    """Load the spaCy pipeline once per process, without components nothing here uses"""
+    import spacy
+    return spacy.load(SPACY_MODEL_NAME, exclude=SPACY_EXCLUDE)
+
+
+@lru_cache(maxsize=None)
+def get_embedding_model():
+    """Load the sentence-transformer once per process"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+
+def preload_models():
+    """Load every model up front, e.g. in a parent process before forking workers"""
+    get_nlp()
+    get_embedding_model()
+
+
+def encode_questions(texts: List[Text]) -> np.ndarray:
+    """Unit-normalised float32 embeddings, so dot products are cosine similarities"""
+    embeddings = get_embedding_model().encode(texts, convert_to_tensor=False,
+                                              normalize_embeddings=True)
+    return np.asarray(embeddings, dtype=np.float32)
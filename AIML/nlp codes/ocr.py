@@ -0,0 +1,160 @@
+from typing import Text, Dict, List, NamedTuple, Optional
+import io
+import os
+import time
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pytesseract  # wraps a locally installed tesseract binary
+except ImportError:
+    pytesseract = None
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+logger = logging.getLogger(__name__)
+
+OCR_DPI = 200
+OCR_LANG = "eng"
+OCR_CACHE_DIR = "ocr_cache"
+MIN_TEXT_CHARS = 16  # pages with less extracted text than this are treated as scanned
+
+
+class OcrPage(NamedTuple):
+    page: int
+    text: Text
+    seconds: float  # render + recognition time for this page (render only on a cache hit)
+    cached: bool
+
+
+def ocr_available() -> bool:
+    if pytesseract is None or (fitz is None and pypdfium2 is None):
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception:
+        return False
+    return True
+
+
+def needs_ocr(text: Optional[Text]) -> bool:
+    return len((text or "").strip()) < MIN_TEXT_CHARS
+
+
+def fill_missing_pages(path: Text, pages: List[Text], max_workers: Optional[int] = None,
+                       cache_dir: Optional[Text] = OCR_CACHE_DIR, first_page: int = 0) -> List[OcrPage]:
+    """
+    OCR the pages of a PDF that came back without a text layer, replacing them in place.
+
+    Text-native pages are never rendered, so searchable documents pay only for the
+    emptiness check. `pages` may be a run of the document starting at `first_page`.
+    Returns the per-page OCR report (empty when nothing needed OCR).
+    """
+    missing = [first_page + i for i, text in enumerate(pages) if needs_ocr(text)]
+    if not missing:
+        return []
+    if not ocr_available():
+        logger.warning("%s has %d pages without text but no OCR engine is installed", path, len(missing))
+        return []
+    report = ocr_pages(path, missing, max_workers=max_workers, cache_dir=cache_dir)
+    for result in report:
+        pages[result.page - first_page] = result.text
+    return report
+
+
+def ocr_pages(path: Text, page_numbers: List[int], max_workers: Optional[int] = None,
+              cache_dir: Optional[Text] = OCR_CACHE_DIR, dpi: int = OCR_DPI,
+              lang: Text = OCR_LANG) -> List[OcrPage]:
+    """
+    Recognise the given (0-based) pages, one process per page.
+
+    Pages are rendered here and keyed by a hash of the rendered image, so a page seen
+    before (the same scan uploaded again, or a shared cover page) is read from the cache.
+    """
+    results: Dict[int, OcrPage] = {}
+    pending = {}
+    for page, png, seconds in _render_pages(path, page_numbers, dpi):
+        key = hashlib.sha256(png + lang.encode()).hexdigest()
+        cached = _cache_get(cache_dir, key)
+        if cached is not None:
+            results[page] = OcrPage(page, cached, seconds, True)
+        else:
+            pending[page] = (png, key, seconds)
+
+    if pending:
+        workers = min(len(pending), max_workers or os.cpu_count() or 1)
+        if workers == 1:
+            texts = [_recognise(png, lang) for png, _, _ in pending.values()]
+        else:
+            # Spawned, not forked: the caller may be a threaded server holding large models
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                texts = list(executor.map(_recognise, [png for png, _, _ in pending.values()],
+                                          [lang] * len(pending)))
+        for (page, (_, key, render_seconds)), (text, ocr_seconds) in zip(pending.items(), texts):
+            _cache_put(cache_dir, key, text)
+            results[page] = OcrPage(page, text, render_seconds + ocr_seconds, False)
+
+    report = [results[page] for page in page_numbers if page in results]
+    for result in report:
+        logger.info("OCR %s page %d: %.2fs%s", os.path.basename(path), result.page + 1,
+                    result.seconds, " (cached)" if result.cached else "")
+    return report
+
+
+def _render_pages(path: Text, page_numbers: List[int], dpi: int):
+    """Yield (page, grayscale PNG bytes, render seconds)"""
+    if fitz is not None:
+        with fitz.open(path) as document:
+            for page in page_numbers:
+                start = time.perf_counter()
+                pixmap = document[page].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+                yield page, pixmap.tobytes("png"), time.perf_counter() - start
+        return
+    document = pypdfium2.PdfDocument(path)
+    try:
+        for page in page_numbers:
+            start = time.perf_counter()
+            image = document[page].render(scale=dpi / 72, grayscale=True).to_pil()
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            yield page, buffer.getvalue(), time.perf_counter() - start
+    finally:
+        document.close()
+
+
+def _recognise(png: bytes, lang: Text):
+    from PIL import Image
+    start = time.perf_counter()
+    text = pytesseract.image_to_string(Image.open(io.BytesIO(png)), lang=lang)
+    return text, time.perf_counter() - start
+
+
+def _cache_get(cache_dir: Optional[Text], key: Text) -> Optional[Text]:
+    if not cache_dir:
+        return None
+    try:
+        with open(os.path.join(cache_dir, f"{key}.txt"), encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _cache_put(cache_dir: Optional[Text], key: Text, text: Text):
+    if not cache_dir:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = os.path.join(cache_dir, f"{key}.{os.getpid()}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, os.path.join(cache_dir, f"{key}.txt"))
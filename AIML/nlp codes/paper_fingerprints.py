@@ -0,0 +1,117 @@
+from typing import Text, List, NamedTuple, Optional
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 16 bands of 4 rows: pairs above ~0.6 Jaccard almost always share a bucket
+SHINGLE_WORDS = 3
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)  # fixed so signatures are comparable across processes and runs
+_A = _rng.integers(1, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+class NearDuplicate(NamedTuple):
+    digest: Text
+    handle: Text
+    similarity: float  # estimated Jaccard similarity of the two papers' question shingles
+    questions: List[Text]
+
+
+def normalise(text: Text) -> Text:
+    """Case, punctuation and spacing differences from re-scans or re-exports do not count"""
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def minhash_signature(questions: List[Text]) -> np.ndarray:
+    """MinHash over word shingles of every question; shingles never span two questions"""
+    hashes = set()
+    for question in questions:
+        words = normalise(question).split()
+        for i in range(max(len(words) - SHINGLE_WORDS + 1, 1)):
+            shingle = " ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8")
+            hashes.add(int.from_bytes(hashlib.blake2b(shingle, digest_size=4).digest(), "little") % _PRIME)
+    if not hashes:
+        return np.full(NUM_PERMUTATIONS, _PRIME, dtype=np.uint32)
+    x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    # One universal hash per permutation, all shingles at once: (a * x + b) mod p stays below 2**63
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def _band_buckets(signature: np.ndarray) -> List[int]:
+    rows = NUM_PERMUTATIONS // BANDS
+    return [int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=7).digest(), "little")
+            for band in signature.reshape(BANDS, rows)]
+
+
+class FingerprintIndex:
+    """
+    Locality-sensitive index of analysed papers.
+
+    Each paper is stored with its MinHash signature, cleaned questions and the handle of
+    its analysis; lookups only compare signatures of papers sharing an LSH band and subject.
+    """
+
+    def __init__(self, path: Text):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(papers)")}
+        if columns and "subject" not in columns:
+            # Fingerprints from before papers were kept per subject cannot be attributed to one;
+            # they only point at short-lived results, so the index starts over
+            self.db.executescript("DROP TABLE papers; DROP TABLE IF EXISTS bands;")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS papers (
+                digest TEXT, subject TEXT, handle TEXT, signature BLOB, questions TEXT, created_at REAL,
+                PRIMARY KEY (digest, subject));
+            CREATE TABLE IF NOT EXISTS bands (band INTEGER, bucket INTEGER, digest TEXT, subject TEXT);
+            CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+        """)
+
+    def add(self, digest: Text, handle: Text, questions: List[Text],
+            signature: Optional[np.ndarray] = None, subject: Text = ""):
+        """Remember a paper's analysis; re-adding a digest points it at the newer handle"""
+        signature = minhash_signature(questions) if signature is None else signature
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM bands WHERE digest = ? AND subject = ?", (digest, subject))
+            self.db.execute("INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?, ?, ?)",
+                            (digest, subject, handle, signature.tobytes(), json.dumps(questions), time.time()))
+            self.db.executemany("INSERT INTO bands VALUES (?, ?, ?, ?)",
+                                [(band, bucket, digest, subject)
+                                 for band, bucket in enumerate(_band_buckets(signature))])
+
+    def find(self, questions: List[Text], min_similarity: float = 0.8,
+             signature: Optional[np.ndarray] = None,
+             exclude: Optional[Text] = None, subject: Text = "") -> Optional[NearDuplicate]:
+        """Most similar known paper of `subject` at or above `min_similarity`, newest first on ties"""
+        signature = minhash_signature(questions) if signature is None else signature
+        buckets = _band_buckets(signature)
+        clause = " OR ".join(["(b.band = ? AND b.bucket = ?)"] * len(buckets))
+        params = [value for pair in enumerate(buckets) for value in pair] + [subject]
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT DISTINCT p.digest, p.handle, p.signature, p.questions, p.created_at "
+                f"FROM bands b JOIN papers p ON p.digest = b.digest AND p.subject = b.subject "
+                f"WHERE ({clause}) AND b.subject = ?", params).fetchall()
+        best = None
+        for digest, handle, blob, stored_questions, created_at in rows:
+            if digest == exclude:
+                continue
+            similarity = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == signature))
+            if similarity >= min_similarity and (best is None or (similarity, created_at) > best[0]):
+                best = ((similarity, created_at), NearDuplicate(digest, handle, similarity,
+                                                                json.loads(stored_questions)))
+        return best[1] if best else None
+
+    def close(self):
+        self.db.close()
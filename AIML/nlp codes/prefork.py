@@ -0,0 +1,175 @@
+"""
+Pre-fork action server.
+
+Models are loaded once in the parent; workers are forked afterwards and share the
+read-only weights copy-on-write instead of each loading their own copy.
+
+    python prefork.py --workers 4 --recycle-after 200
+"""
+from typing import Text, Dict, Optional
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+# Per-process state; only meaningful inside a forked worker
+_recycle_after: Optional[int] = None
+_analyses = 0
+
+
+def record_analysis():
+    """Count a finished analysis so the worker can be recycled after N of them"""
+    global _analyses
+    _analyses += 1
+
+
+def should_recycle() -> bool:
+    return _recycle_after is not None and _analyses >= _recycle_after
+
+
+def memory_usage(pid: int) -> Dict[Text, int]:
+    """Unique (USS), proportional (PSS) and resident (RSS) memory of a process, in bytes"""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "pss": fields.get("Pss", 0),
+        "rss": fields.get("Rss", 0)
+    }
+
+
+class PreforkServer:
+    def __init__(self, actions_package: Text = "actions", workers: int = 2, port: int = 5055,
+                 recycle_after: Optional[int] = None, report_interval: float = 60.0):
+        self.actions_package = actions_package
+        self.workers = workers
+        self.port = port
+        self.recycle_after = recycle_after
+        self.report_interval = report_interval
+        self.children: Dict[int, int] = {}  # pid -> worker slot
+        self.stopping = False
+
+    def serve(self):
+        from rasa_sdk.executor import ActionExecutor
+        from models import preload_models
+
+        # Importing the actions package and loading models happens exactly once, here
+        executor = ActionExecutor()
+        executor.register_package(self.actions_package)
+        preload_models()
+        # Keep the garbage collector from touching (and so copying) the parent's objects
+        gc.freeze()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((os.environ.get("SANIC_HOST", "0.0.0.0"), self.port))
+        sock.listen(1024)
+        sock.set_inheritable(True)
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for slot in range(self.workers):
+            self._spawn(executor, sock, slot)
+        logger.info("Pre-fork action server on port %d with %d workers (parent RSS %d MB)",
+                    self.port, self.workers, memory_usage(os.getpid())["rss"] // 2**20)
+
+        last_report = time.monotonic()
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid in self.children:
+                slot = self.children.pop(pid)
+                if not self.stopping:
+                    logger.info("Worker %d (slot %d) exited with status %d; respawning",
+                                pid, slot, os.waitstatus_to_exitcode(status))
+                    self._spawn(executor, sock, slot)
+                continue
+            if time.monotonic() - last_report >= self.report_interval:
+                self.log_memory()
+                last_report = time.monotonic()
+            time.sleep(0.5)
+        sock.close()
+
+    def memory_report(self) -> Dict[int, Dict[Text, int]]:
+        report = {}
+        for pid in list(self.children):
+            try:
+                report[pid] = memory_usage(pid)
+            except OSError:
+                pass  # exited between listing and reading
+        return report
+
+    def log_memory(self):
+        for pid, usage in self.memory_report().items():
+            logger.info("Worker %d: unique %d MB, proportional %d MB, resident %d MB",
+                        pid, usage["uss"] // 2**20, usage["pss"] // 2**20, usage["rss"] // 2**20)
+
+    def _spawn(self, executor, sock: socket.socket, slot: int):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = slot
+            return
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            self._run_worker(executor, sock, slot)
+        except Exception:
+            logger.exception("Worker crashed")
+            os._exit(1)
+        os._exit(0)
+
+    def _run_worker(self, executor, sock: socket.socket, slot: int):
+        global _recycle_after
+        from rasa_sdk.endpoint import create_app
+        from sanic import response
+        from scheduler import scheduler_metrics
+
+        _recycle_after = self.recycle_after
+        app = create_app(executor)
+
+        @app.get("/scheduler")
+        async def scheduler(request):
+            # Queue depth and wait times of this worker (requests land on any worker)
+            return response.json({"pid": os.getpid(), "actions": scheduler_metrics()})
+
+        @app.on_response
+        async def recycle(request, response):
+            # Stop after the response is written; in-flight requests drain gracefully
+            if should_recycle():
+                logger.info("Worker %d recycling after %d analyses", os.getpid(), _analyses)
+                app.stop()
+
+        app.run(sock=sock, single_process=True, access_log=False, motd=False)
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the action server as pre-forked workers")
+    parser.add_argument("--actions", default="actions")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--recycle-after", type=int, default=None,
+                        help="restart a worker after this many analyses")
+    parser.add_argument("--report-interval", type=float, default=60.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    PreforkServer(args.actions, workers=args.workers, port=args.port,
+                  recycle_after=args.recycle_after, report_interval=args.report_interval).serve()
@@ -0,0 +1,123 @@
+from typing import Iterator, Text, List, Optional, Sequence
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NO_VALUE = -1  # question number / marks / label not known
+
+
+class QuestionBatch:
+    """
+    Columnar set of questions.
+
+    All question text lives in one string and each question is a (start, end) slice
+    of it; question number, sub-question letter, marks and cluster label are small
+    NumPy columns. Text is cleaned once when the batch is built, and stages read
+    slices instead of holding their own per-question lists and dicts.
+    """
+
+    __slots__ = ("buffer", "starts", "ends", "numbers", "subs", "marks", "labels")
+
+    def __init__(self, buffer: Text, starts: np.ndarray, ends: np.ndarray,
+                 numbers: np.ndarray, subs: np.ndarray, marks: np.ndarray, labels: np.ndarray):
+        self.buffer = buffer
+        self.starts = starts
+        self.ends = ends
+        self.numbers = numbers
+        self.subs = subs  # sub-question letter as a code point, 0 when there is none
+        self.marks = marks
+        self.labels = labels
+
+    @classmethod
+    def from_texts(cls, texts: Sequence[Text], numbers: Optional[Sequence[int]] = None,
+                   subs: Optional[Sequence[Text]] = None,
+                   marks: Optional[Sequence[Optional[int]]] = None) -> "QuestionBatch":
+        n = len(texts)
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=n)
+        ends = np.cumsum(lengths)
+        return cls(
+            "".join(texts),
+            ends - lengths,
+            ends,
+            _column(numbers, n, np.int32),
+            np.fromiter((ord(s) if s else 0 for s in subs), dtype=np.uint32, count=n)
+            if subs is not None else np.zeros(n, dtype=np.uint32),
+            _column(marks, n, np.int16),
+            np.full(n, NO_VALUE, dtype=np.int32)
+        )
+
+    @classmethod
+    def concat(cls, batches: Sequence["QuestionBatch"]) -> "QuestionBatch":
+        if not batches:
+            return cls.from_texts([])
+        shifts = np.cumsum([0] + [len(b.buffer) for b in batches[:-1]])
+        return cls(
+            "".join(b.buffer for b in batches),
+            np.concatenate([b.starts + shift for b, shift in zip(batches, shifts)]),
+            np.concatenate([b.ends + shift for b, shift in zip(batches, shifts)]),
+            np.concatenate([b.numbers for b in batches]),
+            np.concatenate([b.subs for b in batches]),
+            np.concatenate([b.marks for b in batches]),
+            np.concatenate([b.labels for b in batches])
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def text(self, i: int) -> Text:
+        return self.buffer[self.starts[i]:self.ends[i]]
+
+    def __iter__(self) -> Iterator[Text]:
+        buffer = self.buffer
+        for start, end in zip(self.starts.tolist(), self.ends.tolist()):
+            yield buffer[start:end]
+
+    def texts(self) -> List[Text]:
+        """Materialise the texts, for APIs that need a real list (e.g. encoders)"""
+        return list(self)
+
+    def sub(self, i: int) -> Text:
+        return chr(self.subs[i]) if self.subs[i] else ""
+
+    def marks_list(self) -> List[Optional[int]]:
+        return [None if m == NO_VALUE else m for m in self.marks.tolist()]
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self.buffer.encode("utf-8")) + self.starts.nbytes + self.ends.nbytes + self.numbers.nbytes
+                + self.subs.nbytes + self.marks.nbytes + self.labels.nbytes)
+
+
+def _column(values: Optional[Sequence[Optional[int]]], n: int, dtype) -> np.ndarray:
+    if values is None:
+        return np.full(n, NO_VALUE, dtype=dtype)
+    return np.fromiter((NO_VALUE if v is None else v for v in values), dtype=dtype, count=n)
+
+
+if __name__ == "__main__":
+    # Memory benchmark: 100k sub-questions as a list of dicts versus one batch
+    import random
+    import tracemalloc
+
+    words = ("explain define compare process memory paging deadlock scheduling algorithm "
+             "thread semaphore virtual file system interrupt cache with suitable example").split()
+    rng = random.Random(0)
+    raw = [(rng.randint(1, 8), rng.choice("abcd"), " ".join(rng.choices(words, k=rng.randint(6, 20))),
+            rng.choice((2, 4, 5, 6, 8, 10))) for _ in range(100_000)]
+
+    tracemalloc.start()
+    records = [{"question_no": no, "sub_question": sub, "question": "".join(text), "marks": marks}
+               for no, sub, text, marks in raw]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    batch = QuestionBatch.from_texts([r[2] for r in raw], numbers=[r[0] for r in raw],
+                                     subs=[r[1] for r in raw], marks=[r[3] for r in raw])
+    batch_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"list of dicts: {dict_bytes / 2**20:.1f} MB")
+    print(f"QuestionBatch: {batch_bytes / 2**20:.1f} MB ({batch.nbytes / 2**20:.1f} MB payload)")
+    print(f"reduction:     {dict_bytes / max(batch_bytes, 1):.1f}x")
@@ -0,0 +1,393 @@
+from typing import Any, Text, Dict, List, Optional, Tuple
+import os
+import re
+import time
+import sqlite3
+import logging
+from collections import Counter
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionIndex:
+    """
+    Persistent per-subject store of historical questions.
+
+    Question metadata and cluster counts live in SQLite; embeddings and cluster
+    centroid sums are append-only float32 files, so inserting a paper only touches
+    rows for that paper and the clusters it hits.
+    """
+
+    def __init__(self, root: Text, subject: Text, check_same_thread: bool = True):
+        self.directory = os.path.join(root, re.sub(r'[^\w-]', '_', subject.lower()) or "general")
+        os.makedirs(self.directory, exist_ok=True)
+        self.embeddings_path = os.path.join(self.directory, "embeddings.f32")
+        self.centroids_path = os.path.join(self.directory, "centroids.f32")
+        self.db = sqlite3.connect(os.path.join(self.directory, "questions.db"),
+                                  check_same_thread=check_same_thread)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS papers (
+                source TEXT PRIMARY KEY, name TEXT, year INTEGER,
+                added_at TEXT DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY, text TEXT, cluster_id INTEGER,
+                source TEXT, marks INTEGER, year INTEGER);
+            CREATE TABLE IF NOT EXISTS clusters (
+                id INTEGER PRIMARY KEY, size INTEGER, papers INTEGER, representative TEXT,
+                years_seen INTEGER DEFAULT 0, last_year INTEGER);
+            CREATE INDEX IF NOT EXISTS questions_source ON questions (source);
+            CREATE TABLE IF NOT EXISTS trends (
+                cluster_id INTEGER, year INTEGER, questions INTEGER, marks INTEGER, papers INTEGER,
+                PRIMARY KEY (cluster_id, year));
+            CREATE TABLE IF NOT EXISTS years (year INTEGER PRIMARY KEY, papers INTEGER, questions INTEGER);
+            CREATE TABLE IF NOT EXISTS topic_scores (
+                cluster_id INTEGER PRIMARY KEY, score REAL, frequency REAL, recency REAL, marks REAL);
+            CREATE INDEX IF NOT EXISTS topic_scores_rank ON topic_scores (score DESC);
+        """)
+        self._migrate()
+        if not self._consistent():
+            with _exclusive_lock(os.path.join(self.directory, ".lock")):
+                self._repair()
+
+    @property
+    def dim(self) -> Optional[int]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+    def paper_count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def has_paper(self, source: Text) -> bool:
+        return self.db.execute("SELECT 1 FROM papers WHERE source = ?", (source,)).fetchone() is not None
+
+    def add_paper(self, source: Text, texts: List[Text], embeddings: np.ndarray,
+                  marks: Optional[List[Optional[int]]] = None, year: Optional[int] = None,
+                  threshold: float = 0.8, name: Optional[Text] = None) -> List[int]:
+        """
+        Insert one paper's questions and return their historical cluster ids.
+
+        Each question joins the most similar existing cluster at or above `threshold`,
+        otherwise it starts a new one; existing clusters are never recomputed.
+        Re-inserting a known source returns the stored cluster ids unchanged.
+        `name` is a display name for the paper when `source` is an opaque key.
+        """
+        if not texts:
+            return []
+        # Appends to the embedding/centroid files must not interleave across threads or workers
+        with _exclusive_lock(os.path.join(self.directory, ".lock")):
+            self._repair()
+            if self.has_paper(source):
+                return self.paper_cluster_ids(source)
+            return self._add_paper(source, texts, embeddings, marks, year, threshold, name)
+
+    def _add_paper(self, source: Text, texts: List[Text], embeddings: np.ndarray,
+                   marks: Optional[List[Optional[int]]], year: Optional[int],
+                   threshold: float, name: Optional[Text]) -> List[int]:
+        embeddings = _unit_rows(np.asarray(embeddings, dtype=np.float32))
+        dim = self.dim
+        if dim is None:
+            dim = embeddings.shape[1]
+            self.db.execute("INSERT INTO meta VALUES ('dim', ?)", (str(dim),))
+        elif embeddings.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match index ({dim})")
+
+        centroid_sums = self._centroid_sums(dim)
+        n_existing = len(centroid_sums)
+        assigned = np.full(len(texts), -1, dtype=np.int64)
+        if n_existing:
+            sims = embeddings @ _unit_rows(np.array(centroid_sums)).T
+            best = sims.argmax(axis=1)
+            hit = sims[np.arange(len(texts)), best] >= threshold
+            assigned[hit] = best[hit]
+
+        # Questions matching no historical cluster are grouped among themselves
+        new_sums: List[np.ndarray] = []
+        for i in np.flatnonzero(assigned == -1):
+            if new_sums:
+                sims = _unit_rows(np.array(new_sums)) @ embeddings[i]
+                best = int(sims.argmax())
+                if sims[best] >= threshold:
+                    assigned[i] = n_existing + best
+                    new_sums[best] = new_sums[best] + embeddings[i]
+                    continue
+            assigned[i] = n_existing + len(new_sums)
+            new_sums.append(embeddings[i].copy())
+
+        # Fixed write order, so a crash at any point is undone by _repair: embedding rows, then the
+        # rows that make them visible, then the centroid sums derived from both
+        with open(self.embeddings_path, "ab") as f:
+            f.write(embeddings.tobytes())
+        marks = marks or [None] * len(texts)
+        with self.db:
+            self.db.execute("INSERT INTO papers (source, name, year) VALUES (?, ?, ?)",
+                            (source, name or source, year))
+            self.db.executemany(
+                "INSERT INTO questions (text, cluster_id, source, marks, year) VALUES (?, ?, ?, ?, ?)",
+                [(t, int(c), source, m, year) for t, c, m in zip(texts, assigned, marks)]
+            )
+            first_text = {}
+            for t, c in zip(texts, assigned):
+                first_text.setdefault(int(c), t)
+            sizes = Counter(int(c) for c in assigned)
+            for cluster_id, representative in first_text.items():
+                size = sizes[cluster_id]
+                if cluster_id < n_existing:
+                    self.db.execute("UPDATE clusters SET size = size + ?, papers = papers + 1 WHERE id = ?",
+                                    (size, cluster_id))
+                else:
+                    self.db.execute("INSERT INTO clusters (id, size, papers, representative) VALUES (?, ?, 1, ?)",
+                                    (cluster_id, size, representative))
+            self._update_trends(assigned, marks, year)
+        self._update_centroids(centroid_sums, assigned, embeddings, n_existing, new_sums)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('centroid_questions', ?)", (str(len(self)),))
+        logger.info("Indexed %d questions from %s (%d new clusters)", len(texts), source, len(new_sums))
+        return [int(c) for c in assigned]
+
+    def paper_cluster_ids(self, source: Text) -> List[int]:
+        return [row[0] for row in self.db.execute(
+            "SELECT cluster_id FROM questions WHERE source = ? ORDER BY id", (source,))]
+
+    def cluster_frequencies(self, cluster_ids: List[int]) -> Dict[int, Tuple[int, int]]:
+        """(questions, papers) seen so far for each requested cluster"""
+        unique_ids = sorted(set(cluster_ids))
+        if not unique_ids:
+            return {}
+        placeholders = ",".join("?" * len(unique_ids))
+        return {row[0]: (row[1], row[2]) for row in self.db.execute(
+            f"SELECT id, size, papers FROM clusters WHERE id IN ({placeholders})", unique_ids)}
+
+    def cluster_trend(self, cluster_id: int) -> Dict[int, Tuple[int, int]]:
+        """(questions, total marks) per exam year for one cluster"""
+        return {row[0]: (row[1], row[2]) for row in self.db.execute(
+            "SELECT year, questions, marks FROM trends WHERE cluster_id = ? ORDER BY year", (cluster_id,))}
+
+    def year_totals(self) -> Dict[int, Tuple[int, int]]:
+        """(papers, questions) indexed per exam year, for normalising trends"""
+        return {row[0]: (row[1], row[2]) for row in self.db.execute(
+            "SELECT year, papers, questions FROM years ORDER BY year")}
+
+    def trend_table(self) -> Dict[Text, np.ndarray]:
+        """The whole trends table as columns, for vectorised scoring"""
+        rows = self.db.execute("SELECT cluster_id, year, questions, marks, papers FROM trends").fetchall()
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 5)
+        return dict(zip(("cluster_id", "year", "questions", "marks", "papers"), columns.T))
+
+    def cluster_papers(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(cluster ids, papers containing each cluster), including papers without a year"""
+        rows = self.db.execute("SELECT id, papers FROM clusters ORDER BY id").fetchall()
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        return columns[:, 0], columns[:, 1]
+
+    def save_topic_scores(self, cluster_ids: np.ndarray, scores: np.ndarray,
+                          components: Dict[Text, np.ndarray], papers: int):
+        """Replace the subject's score table; `papers` records how much history it reflects"""
+        with self.db:
+            self.db.execute("DELETE FROM topic_scores")
+            self.db.executemany("INSERT INTO topic_scores VALUES (?, ?, ?, ?, ?)", zip(
+                cluster_ids.tolist(), scores.tolist(), components["frequency"].tolist(),
+                components["recency"].tolist(), components["marks"].tolist()))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('scored_papers', ?)", (str(papers),))
+
+    def scored_papers(self) -> int:
+        """Paper count the stored topic scores were trained on (-1 if never trained)"""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'scored_papers'").fetchone()
+        return int(row[0]) if row else -1
+
+    def topic_scores(self, k: int = 10) -> List[Dict[Text, Any]]:
+        """Highest scoring clusters with their representative question and trend summary"""
+        columns = ("cluster_id", "score", "frequency", "recency", "marks",
+                   "representative", "years_seen", "last_year", "papers")
+        return [dict(zip(columns, row)) for row in self.db.execute(
+            "SELECT s.cluster_id, s.score, s.frequency, s.recency, s.marks, "
+            "c.representative, c.years_seen, c.last_year, c.papers "
+            "FROM topic_scores s JOIN clusters c ON c.id = s.cluster_id "
+            "ORDER BY s.score DESC LIMIT ?", (k,))]
+
+    def embeddings(self) -> np.ndarray:
+        """Memory-mapped (n_questions, dim) matrix in insertion (question id) order"""
+        dim = self.dim
+        if dim is None or not os.path.exists(self.embeddings_path):
+            return np.empty((0, dim or 0), dtype=np.float32)
+        # Only committed rows: an insert in progress may already have appended its embeddings
+        count = len(self)
+        if not count:
+            return np.empty((0, dim), dtype=np.float32)
+        return np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(count, dim))
+
+    def records(self) -> List[Dict[Text, Any]]:
+        """All question rows in embedding matrix order"""
+        return [record for _, record in self._select_records("ORDER BY q.id")]
+
+    def records_by_id(self, ids: List[int]) -> Dict[int, Dict[Text, Any]]:
+        """Question rows keyed by 0-based position in the embedding matrix; unknown positions are left out"""
+        by_id = {}
+        ids = [int(i) + 1 for i in ids]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row_id, record in self._select_records(f"WHERE q.id IN ({placeholders})", chunk):
+                by_id[row_id - 1] = record
+        return by_id
+
+    def close(self):
+        self.db.close()
+
+    def _select_records(self, clause: Text, params: Tuple = ()):
+        columns = ("text", "cluster_id", "source", "marks", "year", "paper")
+        for row in self.db.execute("SELECT q.id, q.text, q.cluster_id, q.source, q.marks, q.year, p.name "
+                                   f"FROM questions q LEFT JOIN papers p ON p.source = q.source {clause}",
+                                   params):
+            yield row[0], dict(zip(columns, row[1:]))
+
+    # ----------------------- trend aggregates ---------------------------
+    def _update_trends(self, assigned: np.ndarray, marks: List[Optional[int]], year: Optional[int]):
+        """Fold one paper into the per-year counters; papers without a known year are not trended"""
+        if year is None:
+            return
+        per_cluster: Dict[int, List[int]] = {}
+        for c, m in zip(assigned, marks):
+            counts = per_cluster.setdefault(int(c), [0, 0])
+            counts[0] += 1
+            counts[1] += m or 0
+        for cluster_id, (questions, total_marks) in per_cluster.items():
+            first_this_year = self.db.execute(
+                "SELECT 1 FROM trends WHERE cluster_id = ? AND year = ?", (cluster_id, year)).fetchone() is None
+            self.db.execute(
+                "INSERT INTO trends VALUES (?, ?, ?, ?, 1) ON CONFLICT (cluster_id, year) DO UPDATE SET "
+                "questions = questions + excluded.questions, marks = marks + excluded.marks, papers = papers + 1",
+                (cluster_id, year, questions, total_marks))
+            self.db.execute(
+                "UPDATE clusters SET years_seen = years_seen + ?, last_year = MAX(COALESCE(last_year, ?), ?) "
+                "WHERE id = ?", (int(first_this_year), year, year, cluster_id))
+        self.db.execute(
+            "INSERT INTO years VALUES (?, 1, ?) ON CONFLICT (year) DO UPDATE SET "
+            "papers = papers + 1, questions = questions + excluded.questions", (year, len(assigned)))
+
+    def _migrate(self):
+        """Bring indexes created by earlier versions up to date, backfilling from stored rows"""
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(clusters)")}
+        paper_columns = {row[1] for row in self.db.execute("PRAGMA table_info(papers)")}
+        statements = []
+        if "name" not in paper_columns:
+            # Display names arrived with async uploads; older papers are shown by their source
+            statements += ["ALTER TABLE papers ADD COLUMN name TEXT",
+                           "UPDATE papers SET name = source"]
+        if "years_seen" not in columns:
+            statements += [
+                "ALTER TABLE clusters ADD COLUMN years_seen INTEGER DEFAULT 0",
+                "ALTER TABLE clusters ADD COLUMN last_year INTEGER",
+                "INSERT OR IGNORE INTO trends "
+                "SELECT cluster_id, year, COUNT(*), COALESCE(SUM(marks), 0), COUNT(DISTINCT source) "
+                "FROM questions WHERE year IS NOT NULL GROUP BY cluster_id, year",
+                "INSERT OR IGNORE INTO years "
+                "SELECT year, COUNT(DISTINCT source), COUNT(*) "
+                "FROM questions WHERE year IS NOT NULL GROUP BY year",
+                "UPDATE clusters SET "
+                "years_seen = (SELECT COUNT(*) FROM trends t WHERE t.cluster_id = clusters.id), "
+                "last_year = (SELECT MAX(year) FROM trends t WHERE t.cluster_id = clusters.id)"]
+        # Only served likely_to_appear, which topic_scores replaced
+        statements.append("DROP INDEX IF EXISTS clusters_likely")
+        # One explicit transaction (executescript would commit on its own): all or nothing
+        self.db.execute("BEGIN")
+        try:
+            for statement in statements:
+                self.db.execute(statement)
+        except Exception:
+            self.db.rollback()
+            raise
+        self.db.commit()
+
+    # ----------------------- crash recovery ----------------------------
+    def _consistent(self) -> bool:
+        """Files agree with the committed rows: no uncommitted embedding tail, centroids up to date"""
+        dim = self.dim
+        if dim is None:
+            return True
+        count = len(self)
+        size = os.path.getsize(self.embeddings_path) if os.path.exists(self.embeddings_path) else 0
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'centroid_questions'").fetchone()
+        return size == count * dim * 4 and row is not None and int(row[0]) == count
+
+    def _repair(self):
+        """Bring the files back in line with SQLite after a crash mid-insert; call with the lock held"""
+        if self._consistent():
+            return
+        dim, count = self.dim, len(self)
+        size = os.path.getsize(self.embeddings_path) if os.path.exists(self.embeddings_path) else 0
+        if size < count * dim * 4:
+            # Embeddings are written before their rows are committed, so this is not a crash
+            raise RuntimeError(f"{self.embeddings_path} holds fewer rows than the {count} indexed questions")
+        if size > count * dim * 4:
+            os.truncate(self.embeddings_path, count * dim * 4)
+        # Centroid sums may be partly updated; they are derived data, so recompute them
+        cluster_ids = np.array([row[0] for row in self.db.execute("SELECT cluster_id FROM questions ORDER BY id")],
+                               dtype=np.int64)
+        clusters = self.db.execute("SELECT COUNT(*) FROM clusters").fetchone()[0]
+        centroid_sums = np.zeros((clusters, dim), dtype=np.float32)
+        if count:
+            np.add.at(centroid_sums, cluster_ids,
+                      np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(count, dim)))
+        temp_path = f"{self.centroids_path}.{os.getpid()}.tmp"
+        centroid_sums.tofile(temp_path)
+        os.replace(temp_path, self.centroids_path)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('centroid_questions', ?)", (str(count),))
+        logger.warning("Repaired question index %s: %d embedding rows, %d centroids",
+                       self.directory, count, clusters)
+
+    # ----------------------- centroid storage ---------------------------
+    def _centroid_sums(self, dim: int) -> np.ndarray:
+        if not os.path.exists(self.centroids_path) or os.path.getsize(self.centroids_path) == 0:
+            return np.empty((0, dim), dtype=np.float32)
+        return np.memmap(self.centroids_path, dtype=np.float32, mode="r+").reshape(-1, dim)
+
+    def _update_centroids(self, centroid_sums: np.ndarray, assigned: np.ndarray,
+                          embeddings: np.ndarray, n_existing: int, new_sums: List[np.ndarray]):
+        existing = assigned < n_existing
+        if existing.any():
+            # Unbuffered add so repeated cluster ids in one paper all accumulate
+            np.add.at(centroid_sums, assigned[existing], embeddings[existing])
+            centroid_sums.flush()
+        if new_sums:
+            with open(self.centroids_path, "ab") as f:
+                f.write(np.array(new_sums, dtype=np.float32).tobytes())
+
+
+@contextmanager
+def _exclusive_lock(path: Text):
+    """Exclusive lock across threads and processes: flock on POSIX, a byte-range lock on Windows"""
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)  # released when the file is closed
+            yield
+            return
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
@@ -0,0 +1,108 @@
+from typing import Any, Text, Dict, Optional, Tuple
+import os
+import json
+import time
+import sqlite3
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResultStore:
+    """
+    Local store for analysis results, referenced from the tracker by a short handle.
+
+    Keeping the full analysis out of slots keeps every webhook payload and the
+    tracker store the same size no matter how large the paper was.
+    """
+
+    def __init__(self, path: Text, ttl: Optional[float] = None, cache_size: int = 64):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self.cache_size = cache_size
+        # handle -> (created_at, analysis); hits are checked against the TTL like rows are
+        self._cache: "OrderedDict[Text, Tuple[float, Dict[Text, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                handle TEXT PRIMARY KEY, digest TEXT, created_at REAL, payload TEXT, subject TEXT);
+            CREATE INDEX IF NOT EXISTS results_digest ON results (digest);
+            CREATE INDEX IF NOT EXISTS results_created ON results (created_at);
+        """)
+        self._migrate()
+
+    def put(self, analysis: Dict[Text, Any], digest: Optional[Text] = None,
+            subject: Optional[Text] = None) -> Text:
+        """Store an analysis and return its handle"""
+        handle = secrets.token_urlsafe(9)
+        created_at = time.time()
+        with self._lock, self.db:
+            self.db.execute("INSERT INTO results (handle, digest, created_at, payload, subject) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (handle, digest, created_at, json.dumps(analysis), subject))
+            self._remember(handle, created_at, analysis)
+        self.purge_expired()
+        return handle
+
+    def get(self, handle: Optional[Text]) -> Optional[Dict[Text, Any]]:
+        if not handle:
+            return None
+        with self._lock:
+            if handle in self._cache:
+                created_at, analysis = self._cache[handle]
+                if self._expired(created_at):
+                    # Past the retention period even if the purge has not run yet
+                    del self._cache[handle]
+                    return None
+                self._cache.move_to_end(handle)
+                return analysis
+            row = self.db.execute("SELECT payload, created_at FROM results WHERE handle = ?",
+                                  (handle,)).fetchone()
+            if row is None or self._expired(row[1]):
+                return None
+            analysis = json.loads(row[0])
+            self._remember(handle, row[1], analysis)
+            return analysis
+
+    def find_by_digest(self, digest: Text, subject: Optional[Text] = None) -> Optional[Text]:
+        """Handle of the newest unexpired analysis of this exact content, uploaded under `subject`"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT handle, created_at FROM results WHERE digest = ? AND subject IS ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (digest, subject)).fetchone()
+        if row is None or self._expired(row[1]):
+            return None
+        return row[0]
+
+    def purge_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+        with self._lock, self.db:
+            removed = self.db.execute("DELETE FROM results WHERE created_at < ?",
+                                      (time.time() - self.ttl,)).rowcount
+            if removed:
+                self._cache.clear()
+        if removed:
+            logger.info("Purged %d expired analysis results", removed)
+        return removed
+
+    def _migrate(self):
+        """Stores created before results were kept per subject"""
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(results)")}
+        if "subject" not in columns:
+            with self.db:
+                self.db.execute("ALTER TABLE results ADD COLUMN subject TEXT")
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and created_at < time.time() - self.ttl
+
+    def _remember(self, handle: Text, created_at: float, analysis: Dict[Text, Any]):
+        self._cache[handle] = (created_at, analysis)
+        self._cache.move_to_end(handle)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,220 @@
+from typing import Any, Text, Dict, List, Optional, Sequence, Tuple
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from question_batch import NO_VALUE, QuestionBatch
+from cluster_summaries import ClusterSummary, summarise_clusters
+
+logger = logging.getLogger(__name__)
+
+PARQUET = "parquet"
+NUMPY = "npy"
+
+# Column types per table. "str" columns are UTF-8; in .npy parts they are stored as a
+# byte buffer (<col>.data.npy) plus int64 offsets (<col>.offsets.npy), like Arrow strings.
+# Integer columns use -1 for "not known"; float columns use NaN.
+SCHEMA: Dict[Text, Dict[Text, Text]] = {
+    "papers": {"paper": "str", "subject": "str", "name": "str", "year": "int32", "questions": "int32",
+               "clusters": "int32", "difficulty": "str", "exported_at": "float64"},
+    "questions": {"paper": "str", "position": "int32", "text": "str", "number": "int32", "sub": "str",
+                  "marks": "int16", "cluster": "int32", "index_cluster": "int32",
+                  "command_verbs": "str", "sentences": "int16"},
+    "clusters": {"paper": "str", "rank": "int32", "cluster": "int32", "size": "int32", "medoid": "int32",
+                 "representative": "str", "total_marks": "int32", "centroid_similarity": "float64",
+                 "spread": "float64"},
+    "question_types": {"paper": "str", "type": "str", "count": "int32"},
+    "topics": {"paper": "str", "rank": "int16", "terms": "str"}
+}
+
+
+def paper_tables(paper: Text, questions: QuestionBatch, subject: Text = "", name: Text = "",
+                 year: Optional[int] = None, difficulty: Text = "", topics: Sequence[Text] = (),
+                 question_types: Optional[Dict[Text, int]] = None,
+                 index_clusters: Optional[Sequence[int]] = None,
+                 features: Optional[Sequence[Any]] = None,
+                 summaries: Optional[List[ClusterSummary]] = None) -> Dict[Text, Dict[Text, Any]]:
+    """
+    One paper's rows for every table, from the pipeline's own objects.
+
+    Cluster labels are read from `questions.labels`; questions without a label
+    (-1) are left out of the clusters table, whose rows follow the summaries' ranking.
+    Without `summaries` they are computed without embeddings, so the first member
+    stands in for the medoid. `features` are QuestionFeatures.
+    """
+    n = len(questions)
+    labels = questions.labels
+    if summaries is None:
+        summaries = summarise_clusters(labels, marks=questions.marks)
+    question_types = question_types or {}
+    return {
+        "papers": {
+            "paper": [paper], "subject": [subject], "name": [name],
+            "year": [NO_VALUE if year is None else year], "questions": [n], "clusters": [len(summaries)],
+            "difficulty": [difficulty], "exported_at": [time.time()]
+        },
+        "questions": {
+            "paper": [paper] * n,
+            "position": np.arange(n),
+            "text": questions.texts(),
+            "number": questions.numbers,
+            "sub": [questions.sub(i) for i in range(n)],
+            "marks": questions.marks,
+            "cluster": labels,
+            "index_cluster": np.asarray(index_clusters) if index_clusters is not None else np.full(n, NO_VALUE),
+            "command_verbs": [",".join(f.command_verbs) for f in features] if features else [""] * n,
+            "sentences": [f.sentences for f in features] if features else np.full(n, NO_VALUE)
+        },
+        "clusters": {
+            "paper": [paper] * len(summaries),
+            "rank": np.arange(len(summaries)),
+            "cluster": [s.label for s in summaries],
+            "size": [s.size for s in summaries],
+            "medoid": [s.medoid for s in summaries],
+            "representative": [questions.text(s.medoid) for s in summaries],
+            "total_marks": [s.total_marks for s in summaries],
+            "centroid_similarity": [s.centroid_similarity for s in summaries],
+            "spread": [s.spread for s in summaries]
+        },
+        "question_types": {
+            "paper": [paper] * len(question_types),
+            "type": list(question_types),
+            "count": list(question_types.values())
+        },
+        "topics": {"paper": [paper] * len(topics), "rank": np.arange(len(topics)), "terms": list(topics)}
+    }
+
+
+class ResultExporter:
+    """
+    Append-only columnar export of analysis results, for the web platform to load directly.
+
+    Every exported paper adds one part per table under <root>/<table>/, named by the
+    paper's digest: a .parquet file when pyarrow is installed, otherwise a directory
+    of .npy column files that readers can memory-map. Parts are written under a
+    temporary name and renamed, so readers only ever see complete papers, and
+    exporting the same paper again replaces its parts (an .npy part is briefly
+    absent between two renames, never partly written). <root>/schema.json describes
+    the layout; an existing export keeps the format it was started with.
+    """
+
+    def __init__(self, root: Text, fmt: Optional[Text] = None):
+        schema_path = os.path.join(root, "schema.json")
+        existing = None
+        if os.path.exists(schema_path):
+            with open(schema_path, encoding="utf-8") as f:
+                existing = json.load(f)["format"]
+        if existing and fmt and fmt != existing:
+            raise ValueError(f"{root} holds a {existing} export; it cannot be continued as {fmt}")
+        self.root = root
+        # Installing pyarrow later must not mix .parquet parts into an .npy export
+        self.fmt = existing or fmt or (PARQUET if pa is not None else NUMPY)
+        if self.fmt == PARQUET and pa is None:
+            raise ImportError("Parquet export needs pyarrow")
+        for table in SCHEMA:
+            os.makedirs(os.path.join(root, table), exist_ok=True)
+        if existing is None:
+            self._atomic_write(schema_path, json.dumps({"format": self.fmt, "tables": SCHEMA}, indent=2))
+
+    def append_paper(self, paper: Text, tables: Dict[Text, Dict[Text, Any]]):
+        """Write one paper's parts; the papers table goes last, so a listed paper is complete"""
+        for table in sorted(tables, key=lambda t: t == "papers"):
+            columns = {column: tables[table][column] for column in SCHEMA[table]}
+            if self.fmt == PARQUET:
+                self._write_parquet(table, paper, columns)
+            else:
+                self._write_numpy(table, paper, columns)
+        logger.info("Exported %s (%d questions) to %s", paper[:12], len(tables["questions"]["paper"]), self.root)
+
+    def has_paper(self, paper: Text) -> bool:
+        return os.path.exists(self._part_path("papers", paper))
+
+    def papers(self) -> List[Text]:
+        return [paper for paper, _ in self._parts("papers")]
+
+    def read(self, table: Text, columns: Optional[List[Text]] = None) -> Dict[Text, np.ndarray]:
+        """A whole table across all papers, for tools and tests; the dashboard reads parts directly"""
+        columns = columns or list(SCHEMA[table])
+        parts = self._parts(table)
+        if not parts:
+            return {column: np.empty(0, dtype=object if SCHEMA[table][column] == "str" else SCHEMA[table][column])
+                    for column in columns}
+        if self.fmt == PARQUET:
+            data = pq.read_table([path for _, path in parts], columns=columns)
+            return {column: data.column(column).to_numpy() for column in columns}
+        return {column: np.concatenate([self._read_numpy_column(path, column, SCHEMA[table][column])
+                                        for _, path in parts])
+                for column in columns}
+
+    def _parts(self, table: Text) -> List[Tuple[Text, Text]]:
+        suffix = ".parquet" if self.fmt == PARQUET else ""
+        directory = os.path.join(self.root, table)
+        return [(entry[:len(entry) - len(suffix)], os.path.join(directory, entry))
+                for entry in sorted(os.listdir(directory))
+                if ".tmp" not in entry and entry.endswith(suffix)]
+
+    def _part_path(self, table: Text, paper: Text) -> Text:
+        return os.path.join(self.root, table, paper + (".parquet" if self.fmt == PARQUET else ""))
+
+    def _temp_path(self, table: Text, paper: Text) -> Text:
+        return os.path.join(self.root, table, f"{paper}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def _write_parquet(self, table: Text, paper: Text, columns: Dict[Text, Any]):
+        types = {"str": pa.string(), "int16": pa.int16(), "int32": pa.int32(), "float64": pa.float64()}
+        data = pa.table({column: pa.array(np.asarray(values) if SCHEMA[table][column] != "str" else values,
+                                          type=types[SCHEMA[table][column]])
+                         for column, values in columns.items()})
+        temp_path = self._temp_path(table, paper)
+        pq.write_table(data, temp_path)
+        os.replace(temp_path, self._part_path(table, paper))
+
+    def _write_numpy(self, table: Text, paper: Text, columns: Dict[Text, Any]):
+        temp_path = self._temp_path(table, paper)
+        os.makedirs(temp_path)
+        for column, values in columns.items():
+            dtype = SCHEMA[table][column]
+            if dtype == "str":
+                encoded = [value.encode("utf-8") for value in values]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                np.cumsum([len(value) for value in encoded], out=offsets[1:])
+                np.save(os.path.join(temp_path, f"{column}.offsets.npy"), offsets)
+                np.save(os.path.join(temp_path, f"{column}.data.npy"),
+                        np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            else:
+                np.save(os.path.join(temp_path, f"{column}.npy"), np.asarray(values, dtype=dtype))
+        final_path = self._part_path(table, paper)
+        old_path = None
+        if os.path.exists(final_path):
+            # Re-export of the same paper; a directory cannot be renamed over a non-empty one,
+            # so the old part is moved aside (readers skip .tmp names) and removed after the swap
+            old_path = self._temp_path(table, paper) + ".old"
+            os.replace(final_path, old_path)
+        os.replace(temp_path, final_path)
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    @staticmethod
+    def _read_numpy_column(path: Text, column: Text, dtype: Text) -> np.ndarray:
+        if dtype != "str":
+            return np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r")
+        offsets = np.load(os.path.join(path, f"{column}.offsets.npy"))
+        data = np.load(os.path.join(path, f"{column}.data.npy"), mmap_mode="r").tobytes()
+        return np.array([data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])],
+                        dtype=object)
+
+    @staticmethod
+    def _atomic_write(path: Text, text: Text):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
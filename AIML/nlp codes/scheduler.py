@@ -0,0 +1,173 @@
+from typing import Any, Text, Dict, List, Optional
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from concurrent.futures import Future
+from collections import Counter, defaultdict, deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerBusy(Exception):
+    def __init__(self, action_name: Text, queued: int):
+        super().__init__(f"{action_name} queue is full ({queued} waiting)")
+        self.action_name = action_name
+        self.queued = queued
+
+
+class Ticket:
+    """
+    One admitted request; `async with ticket:` waits for a slot and releases it afterwards.
+
+    Work handed to an executor with `hold_until` keeps the slot past the end of the
+    block until it finishes, so a request that gave up waiting (a timeout) still counts
+    against the limit while its thread is busy.
+    """
+
+    def __init__(self, scheduler: "ActionScheduler", action_name: Text, sender_id: Text,
+                 position: int, future: Optional[asyncio.Future]):
+        self.scheduler = scheduler
+        self.action_name = action_name
+        self.sender_id = sender_id
+        self.position = position  # 0 when a slot was free immediately
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.work: Optional[Future] = None
+
+    def hold_until(self, work: Future):
+        self.work = work
+
+    async def __aenter__(self) -> "Ticket":
+        if self.future is not None:
+            try:
+                await self.future
+            except asyncio.CancelledError:
+                if self.future.done() and not self.future.cancelled():
+                    self.scheduler._release(self.action_name, self.sender_id)  # granted just as we left
+                else:
+                    self.future.cancel()
+                    self.scheduler._abandon(self.sender_id)
+                raise
+        self.scheduler._record_wait(self.action_name, time.monotonic() - self.enqueued_at)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.work is not None and not self.work.done():
+            logger.warning("%s for %s left its work running; the slot is held until it finishes",
+                           self.action_name, self.sender_id)
+            loop = asyncio.get_running_loop()
+            self.work.add_done_callback(lambda _: loop.call_soon_threadsafe(
+                self.scheduler._release, self.action_name, self.sender_id))
+            return
+        self.scheduler._release(self.action_name, self.sender_id)
+
+
+class ActionScheduler:
+    """
+    Admission control for expensive actions.
+
+    Each action has a concurrency limit and a bounded priority queue. Waiting requests
+    are ordered by (priority, sender's outstanding requests, arrival), so a single user
+    flooding uploads cannot starve everybody else. When a queue is full new requests
+    are shed immediately with SchedulerBusy.
+    """
+
+    def __init__(self, limits: Dict[Text, int], default_limit: int = 2,
+                 max_queue: int = 20, window: int = 500):
+        self.limits = limits
+        self.default_limit = default_limit
+        self.max_queue = max_queue
+        self.running: Counter = Counter()
+        self.outstanding: Counter = Counter()  # per sender, running + waiting
+        self.queues: Dict[Text, List[List[Any]]] = defaultdict(list)
+        self.admitted: Counter = Counter()
+        self.shed: Counter = Counter()
+        self.wait_times: Dict[Text, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._sequence = itertools.count()
+
+    def submit(self, action_name: Text, sender_id: Text, priority: int = 0) -> Ticket:
+        """Reserve a slot or a queue position; raises SchedulerBusy when the queue is full"""
+        queue = self._live_queue(action_name)
+        limit = self.limits.get(action_name, self.default_limit)
+        if self.running[action_name] < limit and not queue:
+            self.running[action_name] += 1
+            self.outstanding[sender_id] += 1
+            self.admitted[action_name] += 1
+            return Ticket(self, action_name, sender_id, 0, None)
+
+        queued = self._queued(action_name)
+        if queued >= self.max_queue:
+            self.shed[action_name] += 1
+            logger.warning("Shedding %s for %s: %d already queued", action_name, sender_id, queued)
+            raise SchedulerBusy(action_name, queued)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, self.outstanding[sender_id], next(self._sequence), future]
+        heapq.heappush(queue, entry)
+        self.outstanding[sender_id] += 1
+        self.admitted[action_name] += 1
+        position = 1 + sum(1 for other in queue if other[:3] < entry[:3] and not other[3].cancelled())
+        logger.info("Queued %s for %s at position %d", action_name, sender_id, position)
+        return Ticket(self, action_name, sender_id, position, future)
+
+    def metrics(self) -> Dict[Text, Dict[Text, Any]]:
+        """Queue depth, running count, admissions, sheds and recent wait-time percentiles per action"""
+        report = {}
+        for action_name in set(self.running) | set(self.queues) | set(self.shed):
+            waits = np.array(self.wait_times[action_name]) * 1000
+            report[action_name] = {
+                "running": self.running[action_name],
+                "queued": self._queued(action_name),
+                "admitted": self.admitted[action_name],
+                "shed": self.shed[action_name],
+                "wait_ms_p50": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                "wait_ms_p95": float(np.percentile(waits, 95)) if len(waits) else 0.0,
+                "wait_ms_max": float(waits.max()) if len(waits) else 0.0
+            }
+        return report
+
+    def _live_queue(self, action_name: Text) -> List[List[Any]]:
+        queue = self.queues[action_name]
+        while queue and queue[0][3].cancelled():
+            heapq.heappop(queue)
+        return queue
+
+    def _queued(self, action_name: Text) -> int:
+        """Waiting requests; cancelled entries below the heap top are only popped lazily"""
+        return sum(1 for entry in self._live_queue(action_name) if not entry[3].cancelled())
+
+    def _release(self, action_name: Text, sender_id: Text):
+        self._abandon(sender_id)
+        queue = self._live_queue(action_name)
+        if queue:
+            # Hand the slot straight to the next waiter so newcomers cannot jump the queue
+            heapq.heappop(queue)[3].set_result(None)
+        else:
+            self.running[action_name] -= 1
+
+    def _abandon(self, sender_id: Text):
+        self.outstanding[sender_id] -= 1
+        if self.outstanding[sender_id] <= 0:
+            del self.outstanding[sender_id]
+
+    def _record_wait(self, action_name: Text, seconds: float):
+        self.wait_times[action_name].append(seconds)
+
+
+_scheduler: Optional[ActionScheduler] = None
+
+
+def get_scheduler(limits: Optional[Dict[Text, int]] = None, **kwargs) -> ActionScheduler:
+    """Process-wide scheduler; the arguments only apply on the first call"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ActionScheduler(limits or {}, **kwargs)
+    return _scheduler
+
+
+def scheduler_metrics() -> Dict[Text, Dict[Text, Any]]:
+    return _scheduler.metrics() if _scheduler is not None else {}
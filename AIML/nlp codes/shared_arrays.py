@@ -0,0 +1,75 @@
+from typing import Any, Text, Dict, Optional, Tuple
+import sys
+import logging
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+logger = logging.getLogger(__name__)
+
+
+class SharedMatrix:
+    """
+    A NumPy array backed by `multiprocessing.shared_memory`, handed between processes
+    by a small picklable handle instead of pickling the data itself.
+
+    The creating process owns the segment and unlinks it on close; processes that
+    attach only unmap it. Use as a context manager so cleanup happens on errors too.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, shape: Tuple[int, ...],
+                 dtype: Text, owner: bool):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+        self.owner = owner
+        self.array: Optional[np.ndarray] = np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, shape: Tuple[int, ...], dtype: Any = np.float32) -> "SharedMatrix":
+        nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        return cls(shared_memory.SharedMemory(create=True, size=nbytes), shape, dtype, owner=True)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, dtype: Any = None) -> "SharedMatrix":
+        """Copy `array` into a new segment, optionally downcasting (e.g. to float16)"""
+        matrix = cls.create(array.shape, dtype or array.dtype)
+        matrix.array[...] = array
+        return matrix
+
+    @classmethod
+    def attach(cls, handle: Dict[Text, Any]) -> "SharedMatrix":
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=handle["name"], track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=handle["name"])
+            # Before 3.13 attaching also registers the segment. Pool workers share their
+            # parent's resource tracker, where that is a no-op, and unregistering would drop
+            # the creator's own registration. A process with its own tracker must unregister,
+            # or that tracker would unlink the segment when this process exits.
+            if multiprocessing.parent_process() is None:
+                resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, handle["shape"], handle["dtype"], owner=False)
+
+    @property
+    def handle(self) -> Dict[Text, Any]:
+        return {"name": self.shm.name, "shape": self.shape, "dtype": self.dtype}
+
+    @property
+    def nbytes(self) -> int:
+        return self.shm.size
+
+    def close(self):
+        if self.array is None:
+            return
+        # Views must go before the mapping can be released
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self) -> "SharedMatrix":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
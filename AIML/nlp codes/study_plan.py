@@ -0,0 +1,96 @@
+from typing import Any, Text, Dict, List, Optional, Tuple
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from topic_scores import TopicPredictor
+
+logger = logging.getLogger(__name__)
+
+
+def allocate_days(importance: np.ndarray, difficulty: np.ndarray, days: int) -> np.ndarray:
+    """
+    Whole days per topic in proportion to importance * (1 + difficulty).
+
+    Largest-remainder apportionment: every topic gets the floor of its share and the
+    leftover days go to the largest fractional parts, so the total is exactly `days`.
+    Topics whose share rounds to nothing get 0 days.
+    """
+    need = np.asarray(importance, dtype=np.float64) * (1 + np.asarray(difficulty, dtype=np.float64))
+    if days <= 0 or not len(need) or need.sum() <= 0:
+        return np.zeros(len(need), dtype=np.int64)
+    share = need / need.sum() * days
+    allocation = np.floor(share).astype(np.int64)
+    leftover = days - allocation.sum()
+    if leftover:
+        # Stable sort keeps higher-ranked topics first among equal remainders
+        allocation[np.argsort(-(share - allocation), kind="stable")[:leftover]] += 1
+    return allocation
+
+
+class StudyPlanner:
+    """
+    Day-by-day study plans built from a subject's precomputed topic scores.
+
+    Importance is the topic score and difficulty its marks weight. The topic arrays are
+    cached per subject (dropped automatically once its scores are refreshed); a plan for
+    any number of days is apportioned from them on request (tens of microseconds).
+    """
+
+    def __init__(self, predictor: TopicPredictor, revision_share: float = 0.15,
+                 max_topics: int = 20, cache_size: int = 64):
+        self.predictor = predictor
+        self.revision_share = revision_share
+        self.max_topics = max_topics
+        self.cache_size = cache_size
+        # subject -> (topic table it was built from, (importance, difficulty, topic names))
+        self._cache: "OrderedDict[Text, Tuple[Any, Tuple[np.ndarray, np.ndarray, List[Text]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan(self, subject: Text, days: int) -> Optional[Dict[Text, Any]]:
+        """{"sessions": [...], "revision_days": n, "skipped": [...]}, or None without history"""
+        topics = self._topics(subject)
+        return None if topics is None else self._build(*topics, days)
+
+    def _topics(self, subject: Text) -> Optional[Tuple[np.ndarray, np.ndarray, List[Text]]]:
+        table = self.predictor.table(subject)
+        with self._lock:
+            cached = self._cache.get(subject)
+            if cached is not None and cached[0] is table:
+                self._cache.move_to_end(subject)
+                return cached[1]
+        if not table:
+            return None
+
+        top = table[:self.max_topics]
+        topics = (np.array([t["score"] for t in top], dtype=np.float64),
+                  np.array([t["marks"] for t in top], dtype=np.float64),
+                  [t["representative"] for t in top])
+        with self._lock:
+            self._cache[subject] = (table, topics)
+            self._cache.move_to_end(subject)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return topics
+
+    def _build(self, importance: np.ndarray, difficulty: np.ndarray, names: List[Text],
+               days: int) -> Dict[Text, Any]:
+        revision_days = int(round(days * self.revision_share)) if days >= 4 else 0
+        allocation = allocate_days(importance, difficulty, days - revision_days).tolist()
+        sessions, day = [], 1
+        for name, topic_days in zip(names, allocation):
+            if not topic_days:
+                continue
+            sessions.append({
+                "topic": name,
+                "first_day": day,
+                "last_day": day + topic_days - 1,
+                "days": topic_days
+            })
+            day += topic_days
+        return {
+            "sessions": sessions,
+            "revision_days": revision_days,
+            "skipped": [name for name, d in zip(names, allocation) if not d]
+        }
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The pipeline modules are flat files next to this directory, imported by name as the action server does
+MODULE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MODULE_DIR)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: timing checks; deselect with -m 'not slow'")
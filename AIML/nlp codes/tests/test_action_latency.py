@@ -0,0 +1,63 @@
+import asyncio
+import re
+import time
+
+import numpy as np
+import pytest
+from rasa_sdk import Tracker
+from rasa_sdk.executor import CollectingDispatcher
+
+import actions
+
+ANALYSES = 6  # more than Config.ANALYSIS_WORKERS, so some wait in the executor queue
+ANALYSIS_SECONDS = 1.0
+# Seconds for one light action, end to end on the event loop. Typically well under 1 ms; the
+# analysis threads share the GIL, so a few 5 ms switch intervals can be added, never a whole stage
+MAX_LATENCY = 0.05
+
+
+def _analysis_load(seconds: float) -> int:
+    """Stand-in for an analysis: GIL-bound regex/Python work mixed with numpy, like the real stages"""
+    deadline = time.perf_counter() + seconds
+    text = "Q1) a) Define process and explain process states [5] " * 200
+    rng = np.random.default_rng(0)
+    matches = 0
+    while time.perf_counter() < deadline:
+        matches += len(re.findall(r"([a-z])\)\s*(.*?)\s*\[(\d+)\]", text))
+        vectors = rng.standard_normal((256, 64)).astype(np.float32)
+        matches += int((vectors @ vectors.T).argmax())
+    return matches
+
+
+def _tracker(text: str, entities=()) -> Tracker:
+    return Tracker("latency", {}, {"text": text, "intent": {}, "entities": list(entities)}, [], False, None, {}, "")
+
+
+async def _timed(action, tracker: Tracker) -> float:
+    # Scheduled like a webhook request: the latency includes waiting for the event loop
+    start = time.perf_counter()
+    await asyncio.get_running_loop().create_task(action.run(CollectingDispatcher(), tracker, {}))
+    return time.perf_counter() - start
+
+
+async def _light_action_latencies():
+    loop = asyncio.get_running_loop()
+    analyses = [loop.run_in_executor(actions.get_cpu_executor(), _analysis_load, ANALYSIS_SECONDS)
+                for _ in range(ANALYSES)]
+    light = [(actions.ActionHandleSmallTalk(), _tracker("hello there")),
+             (actions.ActionHandleNavigation(), _tracker("go to practice tests",
+                                                         [{"entity": "page", "value": "practice tests"}]))]
+    latencies = []
+    while not all(analysis.done() for analysis in analyses):
+        for action, tracker in light:
+            latencies.append(await _timed(action, tracker))
+        await asyncio.sleep(0.02)
+    await asyncio.gather(*analyses)
+    return latencies
+
+
+@pytest.mark.slow
+def test_light_actions_stay_fast_while_analyses_run():
+    latencies = asyncio.run(_light_action_latencies())
+    assert len(latencies) > 20
+    assert max(latencies) < MAX_LATENCY, f"p50 {np.median(latencies) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms"
@@ -0,0 +1,108 @@
+import random
+import zipfile
+
+import pytest
+
+from ingestion import (DOCX, DOCX_PART, PDF, _MC_FALLBACK, _W, _docx_paragraphs, extract_pages, ingest_many,
+                       iter_pages, throughput_by_format)
+
+# files/s rather than MB/s: the synthetic DOCX compress far better than real ones
+MIN_FILES_PER_SECOND = {DOCX: 100.0, PDF: 5.0}
+
+WORDS = ("explain define compare process memory paging deadlock scheduling algorithm "
+         "thread semaphore virtual file system interrupt cache with suitable example").split()
+
+
+def _lines(pages: int = 20):
+    rng = random.Random(0)
+    return [f"Q{i % 8 + 1}) {' '.join(rng.choices(WORDS, k=rng.randint(6, 20)))} [{rng.choice((2, 4, 6))}]"
+            for i in range(pages * 40)]
+
+
+def _write_docx(path, lines):
+    run = '<w:p><w:r><w:t xml:space="preserve">{}</w:t></w:r></w:p>'
+    # One text box: its paragraphs nest inside a body paragraph, with a legacy copy in mc:Fallback
+    box = ('<w:p><w:r><w:t>Instructions:</w:t></w:r><w:r><mc:AlternateContent><mc:Choice Requires="wps">'
+           '<w:txbxContent>' + run.format("Attempt any five") + '</w:txbxContent></mc:Choice><mc:Fallback>'
+           '<w:txbxContent>' + run.format("Attempt any five") + '</w:txbxContent></mc:Fallback>'
+           '</mc:AlternateContent></w:r><w:r><w:t xml:space="preserve"> questions</w:t></w:r></w:p>')
+    body = box + "".join(run.format(line) for line in lines)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", '<?xml version="1.0"?><Types/>')
+        archive.writestr(DOCX_PART, (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<w:document xmlns:w="{_W[1:-1]}" xmlns:mc="{_MC_FALLBACK[1:].split("}")[0]}">'
+            f'<w:body>{body}</w:body></w:document>'))
+
+
+def _write_pdf(path, lines):
+    pages = [lines[i:i + 40] for i in range(0, len(lines), 40)]
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+                   " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages)),
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, page in enumerate(pages):
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in page)
+        text = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({line}) '" for line in escaped) + " ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+        objects.append(f"<< /Length {len(text)} >>\nstream\n{text}\nendstream")
+    out, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(out)
+
+
+def test_docx_text_box_paragraphs_are_read_once_and_in_order(tmp_path):
+    lines = _lines(pages=1)
+    path = tmp_path / "paper.docx"
+    _write_docx(path, lines)
+    paragraphs = _docx_paragraphs(str(path))
+    assert paragraphs[:3] == ["Instructions: questions", "Attempt any five", lines[0]]
+    assert len(paragraphs) == len(lines) + 2
+
+
+def test_pdf_pages_are_extracted(tmp_path):
+    lines = _lines(pages=2)
+    path = tmp_path / "paper.pdf"
+    _write_pdf(path, lines)
+    [result] = ingest_many([str(path)], max_workers=1)
+    assert result.error is None
+    assert len(result.pages) == 2 and lines[0] in result.pages[0]
+
+
+def test_iter_pages_matches_extract_pages(tmp_path):
+    lines = _lines(pages=40)
+    for fmt, write in ((DOCX, _write_docx), (PDF, _write_pdf)):
+        path = tmp_path / f"paper.{fmt}"
+        write(path, lines)
+        pages = list(iter_pages(str(path)))
+        if fmt == PDF:
+            assert pages == extract_pages(str(path))
+        else:
+            assert len(pages) > 1 and "\n".join(pages) == extract_pages(str(path))[0]
+
+
+@pytest.mark.slow
+def test_throughput_meets_per_format_floors(tmp_path):
+    lines = _lines()
+    paths = []
+    for i in range(8):
+        for fmt, write in ((DOCX, _write_docx), (PDF, _write_pdf)):
+            path = tmp_path / f"paper{i}.{fmt}"
+            write(path, lines)
+            paths.append(str(path))
+    # Best of a few rounds, so one scheduler stall on a shared machine does not fail the floor
+    best = {}
+    for _ in range(3):
+        results = ingest_many(paths, max_workers=1)
+        assert [result.error for result in results if result.error] == []
+        for fmt, stats in throughput_by_format(results).items():
+            best[fmt] = max(best.get(fmt, 0.0), stats["files_per_second"])
+    for fmt, files_per_second in best.items():
+        assert files_per_second >= MIN_FILES_PER_SECOND[fmt], (fmt, files_per_second)
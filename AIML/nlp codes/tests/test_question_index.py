@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from question_index import QuestionIndex
+
+DIM = 16
+QUESTIONS_PER_PAPER = 12
+
+
+def _paper(seed: int):
+    rng = np.random.default_rng(seed)
+    texts = [f"paper {seed} question {i}" for i in range(QUESTIONS_PER_PAPER)]
+    return texts, rng.standard_normal((QUESTIONS_PER_PAPER, DIM)).astype(np.float32)
+
+
+def _add(root: str, seed: int, source: str = None):
+    texts, embeddings = _paper(seed)
+    index = QuestionIndex(root, "os", check_same_thread=False)
+    try:
+        return index.add_paper(source or f"paper-{seed}", texts, embeddings, year=2000 + seed % 5, threshold=0.5)
+    finally:
+        index.close()
+
+
+def _assert_consistent(root: str, papers: int):
+    index = QuestionIndex(root, "os")
+    assert index.paper_count() == papers
+    assert len(index) == papers * QUESTIONS_PER_PAPER
+    # Every question has exactly one embedding row, and every cluster one centroid row
+    assert index.embeddings().shape == (papers * QUESTIONS_PER_PAPER, DIM)
+    clusters = index.db.execute("SELECT COUNT(*), SUM(size) FROM clusters").fetchone()
+    assert clusters[1] == papers * QUESTIONS_PER_PAPER
+    assert os.path.getsize(index.centroids_path) == clusters[0] * DIM * 4
+    assert sum(questions for _, questions in index.year_totals().values()) == papers * QUESTIONS_PER_PAPER
+    index.close()
+
+
+def test_concurrent_threads_keep_index_consistent(tmp_path):
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda seed: _add(str(tmp_path), seed), range(24)))
+    _assert_consistent(str(tmp_path), 24)
+
+
+def test_concurrent_processes_keep_index_consistent(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(4, mp_context=context) as executor:
+        list(executor.map(_add, [str(tmp_path)] * 16, range(16)))
+    _assert_consistent(str(tmp_path), 16)
+
+
+def test_concurrent_inserts_of_one_paper_index_it_once(tmp_path):
+    with ThreadPoolExecutor(6) as executor:
+        results = list(executor.map(lambda _: _add(str(tmp_path), 7, source="same"), range(6)))
+    assert all(result == results[0] for result in results)
+    _assert_consistent(str(tmp_path), 1)
+
+
+def test_reopen_repairs_an_interrupted_insert(tmp_path):
+    root = str(tmp_path)
+    for seed in range(3):
+        _add(root, seed)
+    index = QuestionIndex(root, "os")
+    expected = np.array(index._centroid_sums(DIM))
+    # Crash after the next paper's embeddings were appended but before its rows were committed,
+    # with the centroid update of the previous paper only half done
+    with open(index.embeddings_path, "ab") as f:
+        f.write(np.ones((QUESTIONS_PER_PAPER, DIM), dtype=np.float32).tobytes())
+    with open(index.centroids_path, "r+b") as f:
+        f.write(np.zeros(DIM, dtype=np.float32).tobytes())
+    with index.db:
+        index.db.execute("UPDATE meta SET value = '0' WHERE key = 'centroid_questions'")
+    index.close()
+
+    _assert_consistent(root, 3)
+    index = QuestionIndex(root, "os")
+    np.testing.assert_allclose(index._centroid_sums(DIM), expected, atol=1e-5)
+    index.close()
+    _add(root, 3)
+    _assert_consistent(root, 4)
+
+
+def test_failed_migration_leaves_the_old_schema(tmp_path):
+    index = QuestionIndex(str(tmp_path), "os")
+    index.db.executescript("""
+        DROP TABLE clusters;
+        CREATE TABLE clusters (id INTEGER PRIMARY KEY, size INTEGER, papers INTEGER, representative TEXT);
+        DROP TABLE trends;
+        CREATE TABLE trends (cluster_id INTEGER);  -- backfill into it fails: too few columns
+    """)
+    with pytest.raises(sqlite3.OperationalError):
+        index._migrate()
+    columns = {row[1] for row in index.db.execute("PRAGMA table_info(clusters)")}
+    assert "years_seen" not in columns and "last_year" not in columns
+    index.close()
+
+
+def test_migration_backfills_an_old_index(tmp_path):
+    for seed in range(2):
+        _add(str(tmp_path), seed)
+    index = QuestionIndex(str(tmp_path), "os")
+    expected = index.year_totals()
+    index.db.executescript("""
+        CREATE TABLE old_clusters AS SELECT id, size, papers, representative FROM clusters;
+        DROP TABLE clusters;
+        ALTER TABLE old_clusters RENAME TO clusters;
+        DELETE FROM trends;
+        DELETE FROM years;
+    """)
+    index.close()
+    index = QuestionIndex(str(tmp_path), "os")
+    assert index.year_totals() == expected
+    assert index.db.execute("SELECT COUNT(*) FROM clusters WHERE years_seen = 0").fetchone()[0] == 0
+    index.close()
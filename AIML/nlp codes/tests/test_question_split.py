@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import actions
+from memory_budget import MemoryBudget
+from question_index import QuestionIndex
+
+HEADER = "Operating Systems End Semester Examination May 2024 Time 3 hours Max marks 70"
+PAGES = [f"{HEADER}\nInstructions attempt all questions\nQ1. Define process and explain process states",
+         "Q2. Explain deadlock and its conditions Q3. Compare paging and segmentation"]
+QUESTIONS = ["Define process and explain process states", "Explain deadlock and its conditions",
+             "Compare paging and segmentation"]
+
+
+@pytest.fixture
+def analyzer():
+    return actions.ActionAnalyzeQuestionPaper()
+
+
+def test_header_before_the_first_question_is_dropped(analyzer):
+    questions, head = analyzer._process_pages([" ".join(PAGES)], MemoryBudget())
+    assert questions.texts() == QUESTIONS
+    assert head.startswith(HEADER)
+
+
+def test_header_pages_are_dropped_too(analyzer):
+    cover = f"{HEADER}\nDo not open this booklet until told to"
+    questions, head = analyzer._process_pages([cover] + PAGES, MemoryBudget())
+    assert questions.texts() == QUESTIONS
+    assert head.startswith(cover)
+
+
+def test_pages_past_the_budget_are_never_read(analyzer):
+    def pages():
+        yield from PAGES
+        raise AssertionError("read past the budget")
+
+    budget = MemoryBudget(limit=len(PAGES[0]))  # the first page already fills it
+    questions, _ = analyzer._process_pages(pages(), budget)
+    assert questions.texts() == QUESTIONS[:1]
+    assert budget.adaptations
+
+
+def test_header_is_not_indexed(analyzer, tmp_path):
+    questions, _ = analyzer._process_pages(PAGES, MemoryBudget())
+    index = QuestionIndex(str(tmp_path), "os")
+    index.add_paper("paper", questions.texts(), np.eye(len(questions), 8, dtype=np.float32))
+    texts = [record["text"] for record in index.records()]
+    assert texts == QUESTIONS and not any("Examination" in text for text in texts)
+    index.close()
+
+
+def test_text_without_markers_has_no_questions(analyzer):
+    questions, _ = analyzer._process_pages([HEADER], MemoryBudget())
+    assert len(questions) == 0
@@ -0,0 +1,61 @@
+import os
+import sys
+import subprocess
+import textwrap
+
+import pytest
+
+from conftest import MODULE_DIR
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs POSIX shared memory in /dev/shm")
+
+# Hands a matrix to a spawned pool worker the way _cluster_and_plot does. The resource
+# tracker writes to this script's stderr, so its complaints show up in the captured output.
+HAND_OFF = textwrap.dedent("""
+    import os
+    import sys
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    import numpy as np
+
+    sys.path.insert(0, {module_dir!r})
+    from shared_arrays import SharedMatrix
+
+    def total(handle):
+        with SharedMatrix.attach(handle) as shared:
+            return float(shared.array.sum())
+
+    if __name__ == "__main__":
+        shared = SharedMatrix.from_array(np.ones((64, 8), dtype=np.float32))
+        print(shared.shm.name, flush=True)
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context({context!r})) as executor:
+            assert executor.submit(total, shared.handle).result() == 512.0
+        if {creator_dies}:
+            os._exit(0)  # no close: the resource tracker must reclaim the segment
+        shared.close()
+""")
+
+
+def _hand_off(tmp_path, context: str, creator_dies: bool = False) -> subprocess.CompletedProcess:
+    script = tmp_path / "hand_off.py"
+    script.write_text(HAND_OFF.format(module_dir=MODULE_DIR, context=context, creator_dies=creator_dies))
+    # communicate() waits for the tracker too: it holds the stderr pipe until it exits
+    return subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=120)
+
+
+@pytest.mark.parametrize("context", ["spawn", "fork"])
+def test_hand_off_leaves_no_segment(tmp_path, context):
+    result = _hand_off(tmp_path, context)
+    assert result.returncode == 0, result.stderr
+    name = result.stdout.split()[0].lstrip("/")
+    assert not os.path.exists(os.path.join("/dev/shm", name))
+    assert "Traceback" not in result.stderr, result.stderr
+
+
+def test_segment_reclaimed_when_creator_dies(tmp_path):
+    result = _hand_off(tmp_path, "spawn", creator_dies=True)
+    assert result.returncode == 0, result.stderr
+    name = result.stdout.split()[0].lstrip("/")
+    # The worker's attach must not have dropped the creator's registration
+    assert not os.path.exists(os.path.join("/dev/shm", name))
+    assert "KeyError" not in result.stderr, result.stderr
@@ -0,0 +1,32 @@
+import numpy as np
+
+from question_index import QuestionIndex
+from vector_search import QuestionSearcher
+
+DIM = 8
+
+
+def _index(tmp_path, n=6):
+    index = QuestionIndex(str(tmp_path), "os", check_same_thread=False)
+    index.add_paper("paper", [f"question {i}" for i in range(n)], np.eye(n, DIM, dtype=np.float32), threshold=0.99)
+    return index
+
+
+def test_scores_stay_with_their_questions_when_a_row_is_missing(tmp_path):
+    index = _index(tmp_path)
+    with index.db:
+        index.db.execute("DELETE FROM questions WHERE text = 'question 0'")
+    query = np.array([1.0, 0.9, 0, 0, 0, 0, 0, 0], dtype=np.float32)
+    results = QuestionSearcher(index).search(query, k=2)
+    # Position 0 has no row: its score must not be attached to question 1
+    assert [r["text"] for r in results] == ["question 1"]
+    assert results[0]["similarity"] == np.float32(0.9)
+
+
+def test_uncommitted_embedding_rows_are_not_searched(tmp_path):
+    index = _index(tmp_path)
+    with open(index.embeddings_path, "ab") as f:
+        f.write(np.ones(DIM, dtype=np.float32)[None, :3].tobytes())  # half-written append
+    assert index.embeddings().shape == (6, DIM)
+    searcher = QuestionSearcher(index)
+    assert searcher.size == 6 and not searcher.is_stale()
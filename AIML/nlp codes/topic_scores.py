@@ -0,0 +1,134 @@
+from typing import Any, Text, Dict, List, Optional, Tuple
+import time
+import logging
+import threading
+import numpy as np
+
+from question_index import QuestionIndex
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHTS = {"frequency": 0.5, "recency": 0.3, "marks": 0.2}
+
+
+def score_topics(index: QuestionIndex, weights: Optional[Dict[Text, float]] = None,
+                 half_life: float = 2.0) -> Tuple[np.ndarray, np.ndarray, Dict[Text, np.ndarray]]:
+    """
+    Importance of every historical cluster, computed from the trend aggregates alone.
+
+    frequency: share of past papers that asked the topic
+    recency:   the same share, with each exam year weighted by 0.5 ** (age / half_life)
+    marks:     average marks per question, relative to the highest-weighted topic
+    Returns (cluster ids, scores, components); all three components lie in [0, 1].
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    cluster_ids, cluster_papers = index.cluster_papers()
+    n = len(cluster_ids)
+    total_papers = max(index.paper_count(), 1)
+    components = {name: np.zeros(n) for name in ("frequency", "recency", "marks")}
+    # Papers without a known year still count towards overall frequency
+    components["frequency"] = cluster_papers / total_papers
+
+    trends = index.trend_table()
+    if len(trends["year"]):
+        position = np.searchsorted(cluster_ids, trends["cluster_id"])
+        years, year_index = np.unique(trends["year"], return_inverse=True)
+        totals = index.year_totals()
+        papers_per_year = np.array([totals[y][0] for y in years], dtype=np.float64)
+        decay = 0.5 ** ((years.max() - years) / half_life)
+
+        coverage = trends["papers"] / papers_per_year[year_index]
+        recency = np.bincount(position, weights=coverage * decay[year_index], minlength=n)
+        components["recency"] = recency / decay.sum()
+
+        questions = np.bincount(position, weights=trends["questions"], minlength=n)
+        marks = np.bincount(position, weights=trends["marks"], minlength=n)
+        per_question = np.divide(marks, questions, out=np.zeros(n), where=questions > 0)
+        if per_question.max() > 0:
+            components["marks"] = per_question / per_question.max()
+
+    scores = sum(weights.get(name, 0.0) * values for name, values in components.items())
+    return cluster_ids, np.asarray(scores, dtype=np.float64), components
+
+
+def train_topic_scores(index: QuestionIndex, weights: Optional[Dict[Text, float]] = None,
+                       half_life: float = 2.0) -> int:
+    """Score the subject's clusters and persist the table; returns the number of topics scored"""
+    start = time.perf_counter()
+    papers = index.paper_count()
+    cluster_ids, scores, components = score_topics(index, weights, half_life)
+    index.save_topic_scores(cluster_ids, scores, components, papers)
+    logger.info("Scored %d topics from %d papers in %.1f ms",
+                len(cluster_ids), papers, (time.perf_counter() - start) * 1000)
+    return len(cluster_ids)
+
+
+class TopicPredictor:
+    """
+    Serves "likely to appear" topics from in-memory copies of the persisted score tables.
+
+    A background thread retrains a subject's table when papers have been added since
+    it was last scored, so requests only ever read memory.
+    """
+
+    def __init__(self, root: Text, weights: Optional[Dict[Text, float]] = None,
+                 half_life: float = 2.0, refresh_interval: float = 300.0, cache_size: int = 50):
+        self.root = root
+        self.weights = weights
+        self.half_life = half_life
+        self.refresh_interval = refresh_interval
+        self.cache_size = cache_size
+        self._tables: Dict[Text, List[Dict[Text, Any]]] = {}
+        self._versions: Dict[Text, int] = {}  # paper count each cached table reflects
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+
+    def predict(self, subject: Text, k: int = 10) -> List[Dict[Text, Any]]:
+        """Top-k topics for the subject; an empty list when it has no history"""
+        return self.table(subject)[:k]
+
+    def table(self, subject: Text) -> List[Dict[Text, Any]]:
+        """The cached score table itself; a new list object replaces it on every refresh"""
+        self._start_refresher()
+        table = self._tables.get(subject)
+        if table is None:
+            table = self.refresh(subject)
+        return table
+
+    def refresh(self, subject: Text) -> List[Dict[Text, Any]]:
+        """Retrain if the index has grown, then reload the cached table"""
+        index = QuestionIndex(self.root, subject)
+        try:
+            papers = index.paper_count()
+            if index.scored_papers() != papers:
+                train_topic_scores(index, self.weights, self.half_life)
+            elif self._versions.get(subject) == papers:
+                return self._tables[subject]  # unchanged; keep the object so dependent caches stay valid
+            table = index.topic_scores(self.cache_size)
+            for topic in table:
+                # Per-year history travels with the cached table, so requests never query it
+                topic["trend"] = index.cluster_trend(topic["cluster_id"])
+        finally:
+            index.close()
+        with self._lock:
+            self._tables[subject] = table
+            self._versions[subject] = papers
+        return table
+
+    def _start_refresher(self):
+        if self._refresher is not None or not self.refresh_interval:
+            return
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="topic-scores",
+                                                   daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            for subject in list(self._tables):
+                try:
+                    self.refresh(subject)
+                except Exception as e:
+                    logger.warning(f"Topic score refresh failed for {subject}: {str(e)}")
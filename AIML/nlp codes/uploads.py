@@ -0,0 +1,104 @@
+from typing import Text, List, NamedTuple, Optional
+import os
+import hashlib
+import logging
+import tempfile
+
+from ingestion import PDF, DOCX, PDF_MAGIC, ZIP_MAGIC, DOCX_PART
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ValidatedUpload(NamedTuple):
+    path: Text  # managed copy when a storage area is configured, else the original
+    original_path: Text
+    file_format: Text
+    size: int
+    digest: Text  # sha256 of the content, usable as a cache and dedup key
+
+
+def validate_upload(file_path: Text, max_size: int,
+                    allowed_formats: Optional[List[Text]] = None,
+                    storage_dir: Optional[Text] = None) -> ValidatedUpload:
+    """
+    Validate, hash and optionally store an upload in a single streaming read.
+
+    The size limit is enforced while reading, so oversized files are rejected after
+    at most `max_size` bytes. With `storage_dir`, the content is copied to
+    `<storage_dir>/<digest>.<format>`; identical uploads share one stored file.
+    """
+    allowed_formats = allowed_formats or [PDF, DOCX]
+    if not file_path or not os.path.isfile(file_path):
+        raise ValueError("File not found")
+
+    digest = hashlib.sha256()
+    size = 0
+    file_format = None
+    docx_marker_seen = False
+    tail = b""
+    copy = None
+    try:
+        if storage_dir:
+            os.makedirs(storage_dir, exist_ok=True)
+            copy = tempfile.NamedTemporaryFile(dir=storage_dir, suffix=".part", delete=False)
+
+        with open(file_path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0:
+                    file_format = _format_from_head(chunk)
+                    if file_format not in allowed_formats:
+                        raise ValueError("Unsupported file type")
+                size += len(chunk)
+                if size > max_size:
+                    raise ValueError(f"File exceeds {max_size//1024//1024}MB limit")
+                if file_format == DOCX and not docx_marker_seen:
+                    # Zip local headers carry member names inline; keep an overlap across chunks
+                    docx_marker_seen = DOCX_PART.encode() in tail + chunk
+                    tail = chunk[-len(DOCX_PART):]
+                digest.update(chunk)
+                if copy is not None:
+                    copy.write(chunk)
+
+        if size == 0:
+            raise ValueError("File is empty")
+        if file_format == DOCX and not docx_marker_seen:
+            raise ValueError("Unsupported file type")
+
+        stored_path = file_path
+        if copy is not None:
+            copy.close()
+            stored_path = os.path.join(storage_dir, f"{digest.hexdigest()}.{file_format}")
+            if os.path.exists(stored_path):
+                os.remove(copy.name)  # same content already stored
+            else:
+                os.replace(copy.name, stored_path)
+            copy = None
+    finally:
+        if copy is not None:
+            copy.close()
+            os.remove(copy.name)
+
+    logger.info("Validated %s upload (%d bytes, sha256 %s)", file_format, size, digest.hexdigest()[:12])
+    return ValidatedUpload(stored_path, file_path, file_format, size, digest.hexdigest())
+
+
+def file_digest(path: Text) -> Text:
+    """sha256 of a file on disk; the same key validate_upload returns"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _format_from_head(head: bytes) -> Optional[Text]:
+    if head.startswith(ZIP_MAGIC):
+        return DOCX
+    if PDF_MAGIC in head[:1024]:
+        return PDF
+    return None
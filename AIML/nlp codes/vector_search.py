@@ -0,0 +1,296 @@
+from typing import Any, Text, Dict, List, Optional, Tuple
+import os
+import logging
+import threading
+import numpy as np
+
+from question_index import QuestionIndex
+
+logger = logging.getLogger(__name__)
+
+EXACT_SEARCH_MAX = 100_000  # above this many questions, search an IVF index instead
+IVF_FILENAME = "ivf.npz"
+
+
+def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k columns per row of a score matrix, sorted by descending score"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), np.float32), np.empty((len(scores), 0), np.int64)
+    ids = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top = np.take_along_axis(scores, ids, axis=1)
+    order = np.argsort(-top, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class ExactIndex:
+    """Brute-force search: one matmul against the full unit-normalised embedding matrix"""
+
+    def __init__(self, embeddings: np.ndarray, block_size: int = 262_144):
+        self.embeddings = embeddings
+        self.block_size = block_size
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def search(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(queries).astype(np.float32)
+        best_scores, best_ids = [], []
+        # Blocks bound the (queries x block) score matrix for large memory-mapped corpora
+        for start in range(0, len(self.embeddings), self.block_size):
+            block = np.asarray(self.embeddings[start:start + self.block_size])
+            scores, ids = _top_k(queries @ block.T, k)
+            best_scores.append(scores)
+            best_ids.append(ids + start)
+        if not best_scores:
+            return _top_k(np.empty((len(queries), 0), np.float32), k)
+        scores, picks = _top_k(np.concatenate(best_scores, axis=1), k)
+        return scores, np.take_along_axis(np.concatenate(best_ids, axis=1), picks, axis=1)
+
+
+class IVFIndex:
+    """
+    Approximate search with an inverted-file index.
+
+    Vectors are bucketed by their nearest k-means centroid and stored contiguously per
+    bucket as float16 (half the memory of the corpus); a query only scores the
+    `n_probe` buckets closest to it.
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, ids: np.ndarray,
+                 vectors: np.ndarray, n_probe: int = 16):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.n_probe = n_probe
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, n_lists: Optional[int] = None,
+              n_probe: int = 16, sample_size: int = 200_000, seed: int = 42) -> "IVFIndex":
+        from sklearn.cluster import MiniBatchKMeans
+
+        n = len(embeddings)
+        n_lists = n_lists or max(1, int(4 * np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(embeddings[np.sort(rng.choice(n, min(n, sample_size), replace=False))])
+        kmeans = MiniBatchKMeans(n_clusters=min(n_lists, len(sample)), random_state=seed,
+                                 batch_size=4096, n_init=1).fit(sample)
+        centroids = kmeans.cluster_centers_.astype(np.float32)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        assignments = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 65_536):
+            block = np.asarray(embeddings[start:start + 65_536])
+            assignments[start:start + len(block)] = (block @ centroids.T).argmax(axis=1)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        vectors = np.empty(embeddings.shape, dtype=np.float16)
+        for start in range(0, n, 65_536):
+            vectors[start:start + 65_536] = embeddings[order[start:start + 65_536]]
+        return cls(centroids, offsets, order, vectors, n_probe=n_probe)
+
+    def search(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.atleast_2d(queries).astype(np.float32)
+        n_probe = min(self.n_probe, len(self.centroids))
+        _, probes = _top_k(queries @ self.centroids.T, n_probe)
+        all_scores, all_ids = [], []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            scores, picks = _top_k((self.vectors[rows].astype(np.float32) @ query)[None, :], k)
+            all_scores.append(scores[0])
+            all_ids.append(self.ids[rows[picks[0]]])
+        return np.array(all_scores), np.array(all_ids)
+
+    def save(self, path: Text, n_indexed: int):
+        np.savez(path, centroids=self.centroids, offsets=self.offsets, ids=self.ids,
+                 vectors=self.vectors, n_indexed=n_indexed)
+
+    @classmethod
+    def load(cls, path: Text, n_probe: int = 16) -> Tuple["IVFIndex", int]:
+        data = np.load(path)
+        index = cls(data["centroids"], data["offsets"], data["ids"], data["vectors"], n_probe=n_probe)
+        return index, int(data["n_indexed"])
+
+
+class QuestionSearcher:
+    """
+    Top-k similar historical questions for one subject.
+
+    IVF builds never run on the request path: while one is in progress in the
+    background, the previous index (or exact search) keeps answering, and the new
+    index is swapped in when it is done.
+    """
+
+    def __init__(self, question_index: QuestionIndex, n_probe: int = 16):
+        self.question_index = question_index
+        self.n_probe = n_probe
+        self.ivf_path = os.path.join(question_index.directory, IVF_FILENAME)
+        self.size = 0
+        self._embeddings = None
+        # (index, tail_start, tail), replaced as a whole so a search never sees a half-swapped index
+        self._state: Optional[Tuple[Any, int, ExactIndex]] = None
+        self._refresh_lock = threading.Lock()
+        self._db_lock = threading.Lock()  # the SQLite connection is shared by executor threads
+        self._rebuild: Optional[threading.Thread] = None
+        self.refresh()
+
+    def refresh(self):
+        """Pick up questions inserted since the last refresh"""
+        with self._refresh_lock:
+            with self._db_lock:
+                embeddings = self._embeddings = self.question_index.embeddings()
+            self.size = len(embeddings)
+            index, tail_start = self._state[:2] if self._state else (None, 0)
+            if self.size <= EXACT_SEARCH_MAX:
+                index, tail_start = ExactIndex(embeddings), self.size
+            else:
+                if not isinstance(index, IVFIndex) and os.path.exists(self.ivf_path):
+                    index, tail_start = IVFIndex.load(self.ivf_path, n_probe=self.n_probe)
+                if not isinstance(index, IVFIndex) or tail_start < self.size - self.size // 10:
+                    self._start_rebuild(embeddings)
+                if not isinstance(index, IVFIndex):
+                    # No IVF index yet: search everything exactly until the first build lands
+                    index, tail_start = ExactIndex(embeddings), self.size
+            # Questions inserted after the IVF build are searched exactly until the next rebuild
+            self._state = (index, tail_start, ExactIndex(embeddings[tail_start:]))
+
+    def wait_for_rebuild(self, timeout: Optional[float] = None):
+        rebuild = self._rebuild
+        if rebuild is not None:
+            rebuild.join(timeout)
+
+    def _start_rebuild(self, embeddings: np.ndarray):
+        if self._rebuild is not None and self._rebuild.is_alive():
+            return
+        self._rebuild = threading.Thread(target=self._build_ivf, args=(embeddings,),
+                                         name="ivf-rebuild", daemon=True)
+        self._rebuild.start()
+
+    def _build_ivf(self, embeddings: np.ndarray):
+        size = len(embeddings)
+        try:
+            logger.info("Building IVF index for %d questions", size)
+            index = IVFIndex.build(embeddings, n_probe=self.n_probe)
+            index.save(self.ivf_path, size)
+        except Exception:
+            logger.exception("IVF index build failed; searches keep using the previous index")
+            return
+        with self._refresh_lock:
+            self._state = (index, size, ExactIndex(self._embeddings[size:]))
+
+    def is_stale(self) -> bool:
+        with self._db_lock:
+            return len(self.question_index) != self.size
+
+    def search(self, query_embedding: np.ndarray, k: int = 5) -> List[Dict[Text, Any]]:
+        index, tail_start, tail = self._state
+        scores, ids = index.search(query_embedding, k)
+        if len(tail):
+            tail_scores, tail_ids = tail.search(query_embedding, k)
+            scores, picks = _top_k(np.concatenate([scores, tail_scores], axis=1), k)
+            ids = np.take_along_axis(np.concatenate([ids, tail_ids + tail_start], axis=1), picks, axis=1)
+        with self._db_lock:
+            by_id = self.question_index.records_by_id(ids[0].tolist())
+        records = []
+        for i, score in zip(ids[0].tolist(), scores[0]):
+            record = by_id.get(i)
+            if record is None:
+                logger.warning("Search hit %d has no question row in %s", i, self.question_index.directory)
+                continue
+            records.append(dict(record, similarity=float(score)))
+        return records
+
+
+_searchers: Dict[Tuple[Text, Text], QuestionSearcher] = {}
+_searchers_lock = threading.Lock()
+
+
+def get_searcher(root: Text, subject: Text) -> QuestionSearcher:
+    """Cached searcher per subject, refreshed whenever the question index has grown"""
+    key = (root, subject)
+    with _searchers_lock:
+        searcher = _searchers.get(key)
+        if searcher is None:
+            # Shared across executor threads; the searcher only reads
+            searcher = _searchers[key] = QuestionSearcher(QuestionIndex(root, subject, check_same_thread=False))
+            return searcher
+    # Outside the global lock: a refresh of one subject never holds up another's searches
+    if searcher.is_stale():
+        searcher.refresh()
+    return searcher
+
+
+def _benchmark(n: int, dim: int = 384, queries: int = 500, target_ms: float = 50.0) -> bool:
+    """Search latency and recall on a synthetic corpus; True when p99 is within `target_ms`"""
+    import time
+
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((max(1, n // 200), dim)).astype(np.float32)
+    corpus = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 65_536):
+        block = centres[rng.integers(0, len(centres), min(65_536, n - start))]
+        block += 0.5 * rng.standard_normal(block.shape).astype(np.float32)
+        corpus[start:start + len(block)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    picks = rng.choice(n, queries, replace=False)
+    probes = corpus[picks] + 0.1 * rng.standard_normal((queries, dim)).astype(np.float32)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+
+    def latencies(index) -> np.ndarray:
+        timings = []
+        for query in probes:
+            start = time.perf_counter()
+            index.search(query, 5)
+            timings.append(time.perf_counter() - start)
+        return np.array(timings) * 1000
+
+    exact = ExactIndex(corpus)
+    start = time.perf_counter()
+    ivf = IVFIndex.build(corpus)
+    print(f"IVF build for {n} x {dim}: {time.perf_counter() - start:.1f}s")
+    _, truth = exact.search(probes, 5)
+    _, found = ivf.search(probes, 5)
+    recall = np.mean([len(set(t) & set(f)) / 5 for t, f in zip(truth, found)])
+
+    passed = True
+    for name, index in (("exact", exact), ("ivf", ivf)):
+        timing = latencies(index)
+        p99 = np.percentile(timing, 99)
+        passed &= name == "exact" and n > EXACT_SEARCH_MAX or p99 <= target_ms
+        print(f"{name:>5}: p50 {np.percentile(timing, 50):6.1f} ms  p99 {p99:6.1f} ms")
+    print(f"ivf recall@5: {recall:.2f}")
+
+    # Searches keep being answered by the old index while a rebuild runs in the background
+    rebuild = threading.Thread(target=IVFIndex.build, args=(corpus,), daemon=True)
+    rebuild.start()
+    timing = latencies(ivf if n > EXACT_SEARCH_MAX else exact)
+    rebuilding = rebuild.is_alive()
+    rebuild.join()
+    p99 = np.percentile(timing, 99)
+    passed &= p99 <= target_ms
+    print(f"during rebuild{'' if rebuilding else ' (finished early)'}: "
+          f"p50 {np.percentile(timing, 50):6.1f} ms  p99 {p99:6.1f} ms")
+    print(f"p99 target {target_ms:.0f} ms: {'met' if passed else 'MISSED'}")
+    return passed
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prebuild the IVF search index for a subject")
+    parser.add_argument("subject", nargs="?")
+    parser.add_argument("--root", default="question_index")
+    parser.add_argument("--benchmark", type=int, nargs="?", const=1_000_000, metavar="QUESTIONS",
+                        help="measure search latency on a synthetic corpus instead (exit 1 if p99 > 50 ms)")
+    args = parser.parse_args()
+    if args.benchmark:
+        sys.exit(0 if _benchmark(args.benchmark) else 1)
+    if not args.subject:
+        parser.error("a subject is required unless --benchmark is given")
+    question_index = QuestionIndex(args.root, args.subject)
+    embeddings = question_index.embeddings()
+    IVFIndex.build(embeddings).save(os.path.join(question_index.directory, IVF_FILENAME), len(embeddings))